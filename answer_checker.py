@@ -2,39 +2,32 @@ import json
 import os
 import argparse
 
+from evaluation import GroundTruth, evaluate
+
 def load_json(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
         return json.load(file)
 
 def compare_answers(output_path, ground_truth_path):
     output = load_json(output_path)
-    ground_truth = load_json(ground_truth_path)
-
-    correct_count = 0
-    total_count = len(ground_truth['ground_truths'])
-    incorrect_questions = []
-
-    for output_answer in output['answers']:
-        qid = output_answer['qid']
-        retrieve = output_answer['retrieve']
+    ground_truth = GroundTruth(load_json(ground_truth_path))
 
-        gt_answer = next((item for item in ground_truth['ground_truths'] if item['qid'] == qid), None)
+    result = evaluate(output['answers'], ground_truth)
+    incorrect_questions = result['incorrect']
 
-        if gt_answer and gt_answer['retrieve'] == retrieve:
-            correct_count += 1
-        else:
-            incorrect_questions.append({
-                'qid': qid,
-                'output_retrieve': retrieve,
-                'ground_truth_retrieve': gt_answer['retrieve'] if gt_answer else 'Not found',
-                'category': gt_answer['category'] if gt_answer else 'Unknown'
-            })
+    print(f"Correct answers: {result['correct']}")
+    print(f"Total questions: {result['total']}")
+    print(f"Accuracy: {result['accuracy']:.2%}")
 
-    accuracy = correct_count / total_count if total_count > 0 else 0
+    print("\nAccuracy by category:")
+    for category, stats in result['per_category'].items():
+        print(f"{category}: {stats['correct']}/{stats['total']} ({stats['accuracy']:.2%})")
 
-    print(f"Correct answers: {correct_count}")
-    print(f"Total questions: {total_count}")
-    print(f"Accuracy: {accuracy:.2%}")
+    # 有 top_n（排序後的候選）時才有意義
+    if any('top_n' in answer for answer in output['answers']):
+        print(f"\nMRR: {result['mrr']:.4f}")
+        for k, recall in result['recall'].items():
+            print(f"Recall@{k}: {recall:.2%}")
 
     print("\nIncorrect questions:")
     for q in incorrect_questions:
@@ -0,0 +1,395 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+
+import numpy as np
+import jieba
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組，無法取得 peak RSS
+    resource = None
+
+import bm25_retrieve
+from bm25_tuner import BM25Tuner
+
+
+CATEGORIES = ('insurance', 'finance', 'faq')
+SUITES = ('retrieve', 'index', 'tuner')
+
+# 合成語料用的領域詞與常用字：詞頻依 Zipf 分布，讓 df 與真實 OCR 文件相近
+DOMAIN_WORDS = (
+    '保險金', '被保險人', '要保人', '受益人', '保險費', '保單', '契約', '理賠', '身故', '殘廢',
+    '醫療', '住院', '手術', '意外', '給付', '申請', '條款', '解約', '金額', '年度',
+    '財務', '報表', '營收', '淨利', '資產', '負債', '股東', '權益', '現金', '流量',
+    '投資', '利息', '外幣', '帳戶', '轉帳', '匯款', '信用卡', '貸款', '存款', '利率',
+    '公司', '銀行', '客戶', '服務', '辦理', '變更', '文件', '期間', '季度', '合併',
+)
+COMMON_CHARS = (
+    '的是在了不和有人這中大為上個國我以要他時來用們生到作地於出就分對成會可主發年動同工也能下過子說產種面而方後多定行學法所民得經'
+    '十三之進著等部度家電力裡如水化高自二理起小物現實加量都兩體制機當使點從業本去把性好應開它合還因由其些然前外天政四日那社義事平形相全表間樣與關各重新線內數正心反你明看原又麼利比或但質氣第向道命此變條只沒結解問意建月公無系軍很情者最立代想已通並提直題黨程展五果料象員革位入常文總次品式活設及管特件長求老頭基資邊流路級少圖山統接知較將組見計別她手角期根論運農指幾九區強放決西被幹做必戰先回則任取據處府研質'
+)
+PUNCTUATION = '，。、；：'
+
+
+def make_vocabulary(rng, size):
+    """領域詞加上隨機組成的 2~4 字詞，回傳 (詞彙, Zipf 機率)"""
+    words = list(DOMAIN_WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choice(COMMON_CHARS) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    rng.shuffle(words)
+    weights = 1.0 / np.arange(1, len(words) + 1)
+    return words, weights / weights.sum()
+
+
+def synthetic_text(np_rng, words, probs, length):
+    """以 Zipf 分布抽出 length 個詞組成一段文字，每隔幾個詞插入標點"""
+    picks = np_rng.choice(len(words), size=length, p=probs)
+    parts = []
+    for i, word_id in enumerate(picks):
+        parts.append(words[word_id])
+        if i % 12 == 11:
+            parts.append(PUNCTUATION[word_id % len(PUNCTUATION)])
+    return ''.join(parts)
+
+
+def generate_corpus(n_docs, doc_length, vocab_size, seed=42):
+    """產生三個類別的合成語料：{category: {doc_id: text}}，FAQ 的值為 [{question, answers}]
+
+    保險與金融文件長度在 doc_length 的 0.5~1.5 倍之間（以詞計），FAQ 較短。
+    """
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    words, probs = make_vocabulary(rng, vocab_size)
+    corpus = {}
+    for category in ('insurance', 'finance'):
+        corpus[category] = {
+            doc_id: synthetic_text(np_rng, words, probs, rng.randint(doc_length // 2, doc_length * 3 // 2))
+            for doc_id in range(1, n_docs + 1)
+        }
+    corpus['faq'] = {
+        doc_id: [{'question': synthetic_text(np_rng, words, probs, rng.randint(5, 15)) + '？',
+                  'answers': [synthetic_text(np_rng, words, probs, rng.randint(20, 60))]}]
+        for doc_id in range(n_docs)
+    }
+    return corpus
+
+
+def generate_questions(corpus, n_questions, source_size, query_length, seed=42):
+    """每題從一份目標文件中截取一段文字當作查詢，source 為包含目標的 source_size 份文件
+
+    回傳 (questions, ground_truths)，格式與競賽資料相同。
+    """
+    rng = random.Random(seed + 1)
+    questions, ground_truths = [], []
+    for qid in range(1, n_questions + 1):
+        category = CATEGORIES[qid % len(CATEGORIES)]
+        doc_ids = list(corpus[category])
+        source = rng.sample(doc_ids, min(source_size, len(doc_ids)))
+        target = rng.choice(source)
+        text = str(corpus[category][target])
+        start = rng.randint(0, max(len(text) - query_length, 0))
+        questions.append({'qid': qid, 'source': source, 'query': text[start:start + query_length],
+                          'category': category})
+        ground_truths.append({'qid': qid, 'retrieve': target, 'category': category})
+    return questions, ground_truths
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def write_dataset(root, corpus, questions, ground_truths):
+    """依 bm25_retrieve 與 bm25_tuner 讀取的目錄結構寫出合成資料，回傳 (data_dir, dataset_json_path)"""
+    data_dir = os.path.join(root, 'data')
+    dataset_json_path = os.path.join(root, 'dataset_json')
+    for category in ('insurance', 'finance'):
+        items = {str(doc_id): text for doc_id, text in corpus[category].items()}
+        write_json(os.path.join(dataset_json_path, category, 'merged', f'merged_{category}_corpus.json'), items)
+    write_json(os.path.join(dataset_json_path, 'ocr_json', 'ocr_insurance.json'),
+               {str(doc_id): text for doc_id, text in corpus['insurance'].items()})
+    write_json(os.path.join(dataset_json_path, 'google_doc_json', 'dataset.json'),
+               {str(doc_id): text for doc_id, text in corpus['finance'].items()})
+    write_json(os.path.join(data_dir, 'reference', 'faq', 'pid_map_content.json'),
+               {str(doc_id): value for doc_id, value in corpus['faq'].items()})
+    preliminary = os.path.join(data_dir, 'dataset', 'preliminary')
+    write_json(os.path.join(preliminary, 'questions_example.json'), {'questions': questions})
+    write_json(os.path.join(preliminary, 'ground_truths_example.json'), {'ground_truths': ground_truths})
+    return data_dir, dataset_json_path
+
+
+def peak_rss_mb():
+    """目前 process 的 peak RSS（MB），無法取得時回傳 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位為 KB，macOS 為 bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(latencies):
+    """{category: [秒]} 轉成各類別與全部題目的 p50/p95/p99（毫秒）與 queries/sec"""
+    latencies = dict(latencies)
+    latencies['all'] = [t for category in CATEGORIES for t in latencies.get(category, [])]
+    summary = {}
+    for category, values in latencies.items():
+        if not values:
+            continue
+        values = np.asarray(values) * 1000
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        summary[category] = {
+            'count': len(values),
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'qps': float(len(values) / (values.sum() / 1000)) if values.sum() > 0 else 0.0
+        }
+    return summary
+
+
+def time_queries(questions, retrieve):
+    """逐題計時 retrieve(q_dict)，回傳 {category: [秒]}"""
+    latencies = {}
+    for q_dict in questions:
+        start = time.perf_counter()
+        retrieve(q_dict)
+        latencies.setdefault(q_dict['category'], []).append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_retrieve(corpus, questions):
+    """bm25_retrieve.BM25_retrieve：每題重新分詞候選文件並建立 BM25Okapi"""
+    faq = {doc_id: str(value) for doc_id, value in corpus['faq'].items()}
+    corpus_dicts = {'insurance': corpus['insurance'], 'finance': corpus['finance'], 'faq': faq}
+
+    def retrieve(q_dict):
+        return bm25_retrieve.BM25_retrieve(q_dict['query'], q_dict['source'], corpus_dicts[q_dict['category']])
+
+    return {'latency': summarize(time_queries(questions, retrieve))}
+
+
+def bench_index(corpus, questions):
+    """預建索引：建索引時間、逐題 BM25_retrieve_from_index 延遲與 retrieve_batch 的整批 throughput"""
+    indexes, build_s = {}, {}
+    for category in CATEGORIES:
+        items = [(doc_id, str(text)) for doc_id, text in corpus[category].items()]
+        start = time.perf_counter()
+        indexes[category] = bm25_retrieve.build_index(items, category)
+        build_s[category] = time.perf_counter() - start
+
+    def retrieve(q_dict):
+        return bm25_retrieve.BM25_retrieve_from_index(q_dict['query'], q_dict['source'], indexes[q_dict['category']])
+
+    latency = summarize(time_queries(questions, retrieve))
+    start = time.perf_counter()
+    bm25_retrieve.retrieve_batch(questions, indexes)
+    batch_s = time.perf_counter() - start
+    return {'build_s': build_s, 'latency': latency,
+            'batch': {'seconds': batch_s, 'qps': len(questions) / batch_s if batch_s > 0 else 0.0}}
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    """暫時切換工作目錄（tuner 的輸出檔寫在目前目錄）"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def bench_tuner(data_dir, dataset_json_path, questions, k1=1.2, b=0.75):
+    """BM25Tuner：載入與分詞時間，以及 BM25_retrieve 與 BM25_retrieve_with_weight 的逐題延遲"""
+    with open(os.devnull, 'w') as devnull, working_directory(os.path.dirname(data_dir)), \
+            contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        tuner = BM25Tuner(data_dir, dataset_json_path)
+        build_s = time.perf_counter() - start
+
+        def retrieve(q_dict):
+            return tuner.BM25_retrieve(q_dict['query'], q_dict['source'], q_dict['category'], k1=k1, b=b)
+
+        def retrieve_with_weight(q_dict):
+            return tuner.BM25_retrieve_with_weight(q_dict['query'], q_dict['source'], q_dict['category'], k1=k1, b=b)
+
+        latency = summarize(time_queries(questions, retrieve))
+        weighted_latency = summarize(time_queries(questions, retrieve_with_weight))
+    return {'build_s': {'all': build_s}, 'latency': latency, 'weighted_latency': weighted_latency}
+
+
+_suite_data = None
+
+
+def _init_suite_worker(corpus, questions, data_dir, dataset_json_path):
+    """以 fork 啟動時直接繼承語料，不需 pickle"""
+    global _suite_data
+    _suite_data = (corpus, questions, data_dir, dataset_json_path)
+
+
+def run_suite(suite):
+    """執行一個 suite，並記錄 peak RSS 與這個 suite 執行期間增加的量"""
+    corpus, questions, data_dir, dataset_json_path = _suite_data
+    start_rss = peak_rss_mb()
+    if suite == 'retrieve':
+        result = bench_retrieve(corpus, questions)
+    elif suite == 'index':
+        result = bench_index(corpus, questions)
+    else:
+        result = bench_tuner(data_dir, dataset_json_path, questions)
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['rss_delta_mb'] = None if start_rss is None else result['peak_rss_mb'] - start_rss
+    return result
+
+
+def run_benchmark(args):
+    """產生合成資料並執行指定的 suites，回傳報告"""
+    config = {
+        'n_docs': args.n_docs,
+        'doc_length': args.doc_length,
+        'vocab_size': args.vocab_size,
+        'n_questions': args.n_questions,
+        'source_size': args.source_size,
+        'query_length': args.query_length,
+        'seed': args.seed,
+    }
+    print(f"Generating synthetic corpus: {config}")
+    corpus = generate_corpus(args.n_docs, args.doc_length, args.vocab_size, seed=args.seed)
+    questions, ground_truths = generate_questions(corpus, args.n_questions, args.source_size,
+                                                  args.query_length, seed=args.seed)
+    jieba.initialize()  # 字典載入不計入第一題的延遲
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bm25_bench_')
+    report = {'config': config, 'suites': {}}
+    try:
+        data_dir, dataset_json_path = write_dataset(work_dir, corpus, questions, ground_truths)
+        suite_data = (corpus, questions, data_dir, dataset_json_path)
+        for suite in args.suites:
+            print(f"Running {suite} benchmark...")
+            report['suites'][suite] = run_suite_isolated(suite, suite_data)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def run_suite_isolated(suite, suite_data):
+    """每個 suite 在各自 fork 出的 process 中執行，peak RSS 不會包含其他 suite 的用量
+
+    peak RSS 是 process 的最大值，同一個 process 依序執行時後面的 suite 會沿用前面的峰值。
+    沒有 fork 的平台（Windows，同時也無法取得 RSS）直接在目前 process 執行。
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        _init_suite_worker(*suite_data)
+        return run_suite(suite)
+    context = multiprocessing.get_context('fork')
+    with context.Pool(1, initializer=_init_suite_worker, initargs=suite_data) as pool:
+        return pool.apply(run_suite, (suite,))
+
+
+def print_report(report):
+    for suite, result in report['suites'].items():
+        print(f"\n=== {suite} ===")
+        if 'build_s' in result:
+            print("Build time: " + ', '.join(f"{name} {seconds:.3f}s" for name, seconds in result['build_s'].items()))
+        for key in ('latency', 'weighted_latency'):
+            if key not in result:
+                continue
+            print(f"{key}:")
+            for category, stats in result[key].items():
+                print(f"  {category:<10} n={stats['count']:<6} p50={stats['p50_ms']:.2f}ms "
+                      f"p95={stats['p95_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms qps={stats['qps']:.1f}")
+        if 'batch' in result:
+            print(f"Batch: {result['batch']['seconds']:.3f}s, qps={result['batch']['qps']:.1f}")
+        if result.get('peak_rss_mb') is not None:
+            print(f"Peak RSS: {result['peak_rss_mb']:.1f} MB (+{result['rss_delta_mb']:.1f} MB during the suite)")
+
+
+def compare_reports(report, baseline, tolerance=0.2):
+    """與 baseline 比較延遲（p50/p95/p99）、qps 與建索引時間，回傳超過容忍度的退化項目"""
+    if report['config'] != baseline.get('config'):
+        print(f"Warning: benchmark config differs from baseline: {baseline.get('config')}")
+
+    regressions = []
+
+    def check(name, current, previous, higher_is_better=False):
+        if previous is None or current is None or previous <= 0:
+            return
+        change = (current - previous) / previous
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        print(f"{'REGRESSION ' if worse else ''}{name}: {previous:.4f} -> {current:.4f} ({change:+.1%})")
+        if worse:
+            regressions.append({'metric': name, 'baseline': previous, 'current': current, 'change': change})
+
+    print(f"\n=== Comparison with baseline (tolerance {tolerance:.0%}) ===")
+    for suite, result in report['suites'].items():
+        previous = baseline.get('suites', {}).get(suite)
+        if previous is None:
+            print(f"{suite}: not in baseline, skipped")
+            continue
+        for name, seconds in result.get('build_s', {}).items():
+            check(f"{suite}.build_s.{name}", seconds, previous.get('build_s', {}).get(name))
+        for key in ('latency', 'weighted_latency'):
+            for category, stats in result.get(key, {}).items():
+                old = previous.get(key, {}).get(category, {})
+                for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+                    check(f"{suite}.{key}.{category}.{metric}", stats[metric], old.get(metric))
+                check(f"{suite}.{key}.{category}.qps", stats['qps'], old.get('qps'), higher_is_better=True)
+        if 'batch' in result:
+            check(f"{suite}.batch.qps", result['batch']['qps'], previous.get('batch', {}).get('qps'),
+                  higher_is_better=True)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark BM25 retrieval latency and throughput on a synthetic corpus')
+    parser.add_argument('--n_docs', type=int, default=200, help='每個類別的文件數')
+    parser.add_argument('--doc_length', type=int, default=800, help='保險與金融文件的平均詞數')
+    parser.add_argument('--vocab_size', type=int, default=5000, help='合成詞彙的大小')
+    parser.add_argument('--n_questions', type=int, default=300, help='題目數（三個類別輪流）')
+    parser.add_argument('--source_size', type=int, default=20, help='每題 source 列表的文件數')
+    parser.add_argument('--query_length', type=int, default=12, help='查詢的字數')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES),
+                        help='retrieve：bm25_retrieve.BM25_retrieve；index：預建索引；tuner：BM25Tuner 的檢索')
+    parser.add_argument('--work_dir', type=str, default=None, help='保留合成資料的目錄（預設使用暫存目錄並於結束時刪除）')
+    parser.add_argument('--output', type=str, default=None, help='將報告寫成 JSON')
+    parser.add_argument('--save_baseline', type=str, default=None, help='將報告存為 baseline')
+    parser.add_argument('--baseline', type=str, default=None, help='與此 baseline 比較，有退化時以 exit code 1 結束')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允許的相對退化幅度')
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    print_report(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"Report saved to: {path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed beyond {args.tolerance:.0%}")
+            raise SystemExit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,668 @@
+import os
+import math
+import pickle
+
+import numpy as np
+from scipy import sparse
+
+
+INDEX_FORMAT_VERSION = 2
+
+
+def rank_top_n(doc_ids, scores, n=1):
+    """依分數由高到低回傳前 n 個 (doc_id, score)，同分時保留候選順序
+
+    n 小於候選數時以 argpartition 先選出前 n 個再排序，不需排序全部候選；
+    結果與完整的 stable 排序相同。
+    """
+    scores = np.asarray(scores, dtype=float)
+    neg = -scores
+    if n <= 0 or n >= len(scores):
+        top_n = np.argsort(neg, kind='stable')[:n]
+    else:
+        kth = neg[np.argpartition(neg, n - 1)[n - 1]]
+        better = np.flatnonzero(neg < kth)
+        ties = np.flatnonzero(neg == kth)[:n - len(better)]
+        selected = np.sort(np.concatenate((better, ties)))
+        if len(selected) < n:  # 分數中有 NaN 時退回完整排序
+            top_n = np.argsort(neg, kind='stable')[:n]
+        else:
+            top_n = selected[np.argsort(neg[selected], kind='stable')]
+    return [(int(doc_ids[i]), float(scores[i])) for i in top_n]
+
+
+def index_path(index_dir, category, passages=False, incremental=False):
+    """回傳 category 索引檔的路徑，段落索引與增量更新（各文件檔）的索引各自另存一個檔案"""
+    suffix = ''
+    if incremental:
+        suffix += '_files'
+    if passages:
+        suffix += '_passages'
+    return os.path.join(index_dir, f"bm25_{category}{suffix}.idx")
+
+
+def _dump_state(path, state):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump(dict(state, version=INDEX_FORMAT_VERSION), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _load_state(path):
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state.pop('version', None) != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported index version in {path}")
+    return state
+
+
+class Vocabulary:
+    """詞彙表：將詞 intern 成連續的 int32 term id
+
+    文件與查詢都以 term id 陣列表示，計數與比對不必再做字串比較；
+    多個類別的索引可共用同一份詞彙表。
+    """
+
+    def __init__(self, terms=()):
+        self.terms = []  # term id -> term
+        self.ids = {}    # term -> term id
+        for term in terms:
+            self.add(term)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self.ids
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __getstate__(self):
+        # 只存詞列表，term -> id 在載入時重建
+        return {'terms': self.terms}
+
+    def __setstate__(self, state):
+        self.terms = state['terms']
+        self.ids = {term: term_id for term_id, term in enumerate(self.terms)}
+
+    def get(self, term, default=None):
+        return self.ids.get(term, default)
+
+    def add(self, term):
+        """回傳 term 的 id，新詞會加到詞彙表最後"""
+        term_id = self.ids.get(term)
+        if term_id is None:
+            term_id = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def encode(self, tokens):
+        """將詞序列轉為 int32 term id 陣列，新詞會加入詞彙表"""
+        return np.fromiter(map(self.add, tokens), dtype=np.int32)
+
+    def decode(self, term_ids):
+        """將 term id 陣列轉回詞"""
+        terms = self.terms
+        return [terms[term_id] for term_id in term_ids]
+
+
+class BM25Index:
+    """預先建立的 BM25 倒排索引
+
+    索引只需建立一次：postings（term -> doc, tf）、文件長度與全域統計都存在磁碟上，
+    查詢時直接對 source 子集合計分，不必再重新分詞或建立 BM25Okapi。
+    """
+
+    def __init__(self, doc_ids, vocab, doc_indptr, doc_terms, doc_tfs, meta=None):
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        self.vocab = vocab  # Vocabulary：term <-> term id
+        self.meta = meta or {}
+
+        # forward index：每份文件的 term id 與 tf（依 term id 排序）
+        self.doc_indptr = np.asarray(doc_indptr, dtype=np.int64)
+        self.doc_terms = np.asarray(doc_terms, dtype=np.int32)
+        self.doc_tfs = np.asarray(doc_tfs, dtype=np.int32)
+
+        self._build_postings()
+        self._id_order = np.argsort(self.doc_ids, kind='stable')
+        self._average_idf = None
+
+    def _build_postings(self):
+        """由 forward index 推出 postings 與全域統計"""
+        n_docs = len(self.doc_ids)
+        entry_doc = np.repeat(np.arange(n_docs, dtype=np.int32), np.diff(self.doc_indptr))
+
+        # stable 排序讓同一個 term 的 postings 依 doc 順序排列
+        order = np.argsort(self.doc_terms, kind='stable')
+        self.term_docs = entry_doc[order]
+        self.term_tfs = self.doc_tfs[order]
+        # 詞彙表可能由多個索引共用並在之後繼續增長，只記錄建立時的詞數
+        self.n_terms = len(self.vocab)
+        term_counts = np.bincount(self.doc_terms, minlength=self.n_terms)
+        self.term_indptr = np.concatenate(([0], np.cumsum(term_counts))).astype(np.int64)
+
+        self.doc_lens = np.bincount(entry_doc, weights=self.doc_tfs, minlength=n_docs).astype(np.int64)
+        self.doc_freqs = term_counts.astype(np.int64)
+        self.avgdl = float(self.doc_lens.mean()) if n_docs else 0.0
+
+    @classmethod
+    def build(cls, docs, meta=None, vocab=None):
+        """由 (doc_id, tokens) 序列建立索引"""
+        vocab = vocab if vocab is not None else Vocabulary()
+        return cls.from_token_ids(((doc_id, vocab.encode(tokens)) for doc_id, tokens in docs), vocab, meta=meta)
+
+    @classmethod
+    def from_token_ids(cls, docs, vocab, meta=None):
+        """由 (doc_id, term id 陣列) 序列建立索引，tf 以一次 np.unique 計數"""
+        doc_ids = []
+        arrays = []
+        for doc_id, term_ids in docs:
+            doc_ids.append(int(doc_id))
+            arrays.append(np.asarray(term_ids, dtype=np.int64))
+
+        n_docs = len(doc_ids)
+        n_terms = max(len(vocab), 1)
+        lengths = np.array([len(term_ids) for term_ids in arrays], dtype=np.int64)
+        entry_doc = np.repeat(np.arange(n_docs, dtype=np.int64), lengths)
+        all_terms = np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+
+        # (doc, term) 編成單一 key，排序後同一份文件的 term 連續且依 id 排列
+        keys, doc_tfs = np.unique(entry_doc * n_terms + all_terms, return_counts=True)
+        doc_terms = keys % n_terms
+        doc_counts = np.bincount(keys // n_terms, minlength=n_docs)
+        doc_indptr = np.concatenate(([0], np.cumsum(doc_counts)))
+
+        return cls(doc_ids, vocab, doc_indptr, doc_terms, doc_tfs, meta=meta)
+
+    def apply_changes(self, docs=(), removed=()):
+        """增量更新索引：新增或取代 docs 中的 (doc_id, tokens)，並移除 removed 中的文件
+
+        只有變動的文件需要分詞；其餘文件沿用原本的 forward index（依原順序），
+        新文件接在最後，postings、文件長度與全域統計再由 forward index 重新推出。
+        """
+        new = BM25Index.build(docs, vocab=self.vocab)
+        drop_ids = np.union1d(np.fromiter((int(doc_id) for doc_id in removed), dtype=np.int64), new.doc_ids)
+        keep = ~np.isin(self.doc_ids, drop_ids)
+        doc_counts = np.diff(self.doc_indptr)
+        entry_keep = np.repeat(keep, doc_counts)
+
+        counts = np.concatenate((doc_counts[keep], np.diff(new.doc_indptr)))
+        self.doc_ids = np.concatenate((self.doc_ids[keep], new.doc_ids))
+        self.doc_indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.doc_terms = np.concatenate((self.doc_terms[entry_keep], new.doc_terms)).astype(np.int32)
+        self.doc_tfs = np.concatenate((self.doc_tfs[entry_keep], new.doc_tfs)).astype(np.int32)
+
+        self._build_postings()
+        self._id_order = np.argsort(self.doc_ids, kind='stable')
+        self._average_idf = None
+
+    def state(self):
+        """索引的可序列化狀態"""
+        return {
+            'meta': self.meta,
+            'doc_ids': self.doc_ids,
+            'vocab': self.vocab,
+            'doc_indptr': self.doc_indptr,
+            'doc_terms': self.doc_terms,
+            'doc_tfs': self.doc_tfs,
+            'term_indptr': self.term_indptr,
+            'term_docs': self.term_docs,
+            'term_tfs': self.term_tfs,
+            'doc_lens': self.doc_lens,
+            'doc_freqs': self.doc_freqs,
+            'n_terms': self.n_terms,
+            'avgdl': self.avgdl,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """由 state() 的結果還原索引，不需重建 postings"""
+        index = cls.__new__(cls)
+        for key, value in state.items():
+            setattr(index, key, value)
+        index._id_order = np.argsort(index.doc_ids, kind='stable')
+        index._average_idf = None
+        return index
+
+    def save(self, path):
+        """將索引寫入磁碟"""
+        _dump_state(path, self.state())
+
+    @classmethod
+    def load(cls, path):
+        """從磁碟載入索引"""
+        return cls.from_state(_load_state(path))
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def terms(self):
+        """term id -> term"""
+        return self.vocab.terms
+
+    def term_id(self, token):
+        """回傳詞在此索引中的 term id，沒有時回傳 None"""
+        term_id = self.vocab.get(token)
+        if term_id is None or term_id >= self.n_terms:
+            return None
+        return term_id
+
+    def positions(self, source):
+        """將 source 中的 doc id 轉為索引內的位置（0..N-1 的連續編號）"""
+        ids = np.fromiter((int(file) for file in source), dtype=np.int64)
+        loc = np.searchsorted(self.doc_ids, ids, sorter=self._id_order)
+        loc[loc == len(self._id_order)] = 0
+        positions = self._id_order[loc] if len(self._id_order) else loc
+        missing = self.doc_ids[positions] != ids if len(self._id_order) else np.ones(len(ids), dtype=bool)
+        if missing.any():
+            raise KeyError(int(ids[np.argmax(missing)]))
+        return positions.astype(np.int64)
+
+    def postings(self, term_id):
+        """回傳 term 的 (doc 位置, tf) 陣列"""
+        start, end = self.term_indptr[term_id], self.term_indptr[term_id + 1]
+        return self.term_docs[start:end], self.term_tfs[start:end]
+
+    def candidates(self, source, idf_scope='subset'):
+        """建立 source 子集合的 CandidateSet，同一組 source 的多個查詢可共用
+
+        source 已是 CandidateSet 時直接沿用（idf_scope 以它建立時的設定為準）。
+        """
+        if isinstance(source, CandidateSet):
+            return source
+        return CandidateSet(self, source, idf_scope=idf_scope)
+
+    def average_idf(self):
+        """整個類別詞彙的平均 BM25Okapi idf，只算一次"""
+        if self._average_idf is None:
+            df = self.doc_freqs[self.doc_freqs > 0]
+            idf = np.log(len(self.doc_ids) - df + 0.5) - np.log(df + 0.5)
+            self._average_idf = float(idf.mean()) if len(idf) else 0.0
+        return self._average_idf
+
+    def get_scores(self, query_tokens, source, k1=1.5, b=0.75, epsilon=0.25, idf_scope='subset'):
+        """計算 source 候選文件的 BM25Okapi 分數
+
+        idf_scope='subset' 時 N、df、avgdl 以 source 子集合計算，結果與逐題建立 BM25Okapi 相同；
+        'global' 時使用預先算好的整個類別統計量。
+        """
+        candidates = self.candidates(source, idf_scope)
+        # 只累加 postings 與候選遮罩交集中的文件，沒有任何查詢詞的文件不會被碰到
+        scores = np.zeros(len(self.doc_ids))
+
+        for token in query_tokens:
+            term_id = self.term_id(token)
+            if term_id is None:
+                continue
+            term_scores = candidates.okapi_term_scores(term_id, k1, b, epsilon)
+            if term_scores is not None:
+                docs, doc_scores = term_scores
+                scores[docs] += doc_scores
+
+        return scores[candidates.positions]
+
+    def get_batch_scores(self, queries, source, k1=1.5, b=0.75, epsilon=0.25, idf_scope='subset'):
+        """同一組 source 的多個查詢一起計分，回傳 n_queries x n_candidates 的分數矩陣
+
+        子集合統計量與各詞的分數只算一次，每列的結果與單獨呼叫 get_scores 完全相同。
+        """
+        candidates = self.candidates(source, idf_scope)
+        scores = np.zeros((len(queries), candidates.n))
+        for row, query_tokens in enumerate(queries):
+            scores[row] = self.get_scores(query_tokens, candidates, k1=k1, b=b, epsilon=epsilon)
+        return scores
+
+    def get_top_n(self, query_tokens, source, n=1, k1=1.5, b=0.75, idf_scope='subset'):
+        """回傳分數最高的 n 個 (doc_id, score)"""
+        candidates = self.candidates(source, idf_scope)
+        scores = self.get_scores(query_tokens, candidates, k1=k1, b=b)
+        return rank_top_n(candidates.doc_ids, scores, n)
+
+    def _query_terms(self, query_tokens, query_weights):
+        """將查詢詞轉為 term id，重複出現的詞權重相加"""
+        coef = {}
+        for token, weight in zip(query_tokens, query_weights):
+            term_id = self.term_id(token)
+            if term_id is not None:
+                coef[term_id] = coef.get(term_id, 0.0) + weight
+        return np.fromiter(coef.keys(), dtype=np.int64, count=len(coef)), np.fromiter(coef.values(), dtype=float, count=len(coef))
+
+    def prepare_weighted(self, query_tokens, query_weights, source, idf_scope='subset'):
+        """預先計算與 k1、b 無關的加權 BM25 統計量
+
+        idf = log((N - df + 0.5) / (df + 0.5) + 1)，N、df 與平均長度依 idf_scope
+        以 source 子集合或整個類別計算。各詞的 tf 由 postings 與候選遮罩取交集，
+        計算量只與查詢詞的 postings 長度有關，不需掃描候選文件的內容。
+        """
+        candidates = self.candidates(source, idf_scope)
+        term_ids, weights = self._query_terms(query_tokens, query_weights)
+
+        rows, cols, counts = [], [], []
+        df = np.zeros(len(term_ids), dtype=np.int64)
+        for j, term_id in enumerate(term_ids):
+            docs, tfs, subset_df = candidates.hits(term_id)
+            doc_rows, repeat = candidates.rows_of(docs)
+            rows.append(doc_rows)
+            cols.append(np.full(len(doc_rows), j, dtype=np.int64))
+            counts.append(np.repeat(tfs, repeat))
+            df[j] = candidates.doc_freq(term_id, subset_df)
+
+        if rows:
+            rows, cols, counts = np.concatenate(rows), np.concatenate(cols), np.concatenate(counts)
+        tf = sparse.csr_matrix((counts, (rows, cols)), shape=(candidates.n, len(term_ids)))
+        tf.sort_indices()
+
+        n = candidates.stats_n
+        idf = np.log((n - df + 0.5) / (df + 0.5) + 1.0)
+
+        return WeightedQuery(candidates.doc_ids, term_ids, weights, idf, tf, candidates.relative_len)
+
+
+class WeightedQuery:
+    """一個查詢對候選文件的加權 BM25 統計量（tf、文件長度、idf、權重）
+
+    這些統計量與 k1、b 無關，grid search 換參數時只需重算 BM25 的飽和函數。
+    """
+
+    def __init__(self, doc_ids, term_ids, weights, idf, tf, relative_len):
+        self.doc_ids = doc_ids
+        self.term_ids = term_ids
+        self.weights = weights
+        self.idf = idf
+        self.tf = tf  # n_candidates x n_terms 的 CSR
+        self.coef = idf * weights
+
+        self._rows = np.repeat(np.arange(tf.shape[0]), np.diff(tf.indptr))
+        self._counts = tf.data.astype(float)
+        self._relative_len = relative_len[self._rows]
+
+    def saturated(self, k1=1.5, b=0.75):
+        """回傳每個 (候選文件, 查詢詞) 的 tf 飽和值，尚未乘上 idf 與權重"""
+        saturated = self.tf.astype(float)
+        norm_factor = 1 - b + b * self._relative_len
+        saturated.data = (self._counts * (k1 + 1)) / (self._counts + k1 * norm_factor)
+        return saturated
+
+    def scores(self, k1=1.5, b=0.75):
+        """以給定的 k1、b 計算所有候選文件的分數"""
+        return self.saturated(k1=k1, b=b) @ self.coef
+
+
+class CandidateSet:
+    """一組 source 候選文件的子集合統計量
+
+    位置、文件長度、avgdl、各詞的 tf/df 與分數都只算一次，
+    讓 source 相同的多個查詢共用。source 轉成以索引位置為下標的候選遮罩，
+    計分時只走查詢詞的 postings 與遮罩的交集。idf_scope='global' 時 N、df、avgdl
+    改用索引預先算好的整個類別統計量，候選集合只用來取 tf。
+    """
+
+    IDF_SCOPES = ('subset', 'global')
+
+    def __init__(self, index, source, idf_scope='subset'):
+        if idf_scope not in self.IDF_SCOPES:
+            raise ValueError(f"Unknown idf_scope: {idf_scope}")
+        self.index = index
+        self.idf_scope = idf_scope
+        self.doc_ids = [int(file) for file in source]
+        self.positions = index.positions(self.doc_ids)
+        self.n = len(self.positions)
+        self.doc_len = index.doc_lens[self.positions]
+
+        # 候選遮罩：每份文件在 source 中出現的次數（source 可能重複列出同一份文件）
+        self.counts = np.bincount(self.positions, minlength=len(index))
+        self._order = np.argsort(self.positions, kind='stable')
+        self._sorted_positions = self.positions[self._order]
+
+        if idf_scope == 'global':
+            self.stats_n = len(index)
+            self.avgdl = index.avgdl
+        else:
+            self.stats_n = self.n
+            self.avgdl = int(self.doc_len.sum()) / self.n if self.n else 0.0
+
+        self._average_idf = None
+        self._hits = {}
+        self._term_scores = {}
+
+    @property
+    def relative_len(self):
+        """文件長度 / 平均長度"""
+        return self.doc_len / self.avgdl if self.avgdl else self.doc_len.astype(float)
+
+    def hits(self, term_id):
+        """term 的 postings 與候選遮罩的交集：(doc 位置, tf, 子集合 df)"""
+        hits = self._hits.get(term_id)
+        if hits is None:
+            docs, tfs = self.index.postings(term_id)
+            keep = self.counts[docs] > 0
+            docs, tfs = docs[keep], tfs[keep]
+            hits = (docs, tfs, int(self.counts[docs].sum()))
+            self._hits[term_id] = hits
+        return hits
+
+    def rows_of(self, docs):
+        """將命中的 doc 位置轉為候選列表中的列（依 doc 順序），回傳 (列, 每個 doc 對應幾列)"""
+        start = np.searchsorted(self._sorted_positions, docs, side='left')
+        repeat = self.counts[docs]
+        offsets = np.arange(int(repeat.sum())) - np.repeat(np.cumsum(repeat) - repeat, repeat)
+        return self._order[np.repeat(start, repeat) + offsets], repeat
+
+    def doc_freq(self, term_id, subset_df):
+        """計算 idf 用的 df：子集合 df 或整個類別的 df"""
+        if self.idf_scope == 'global':
+            return int(self.index.doc_freqs[term_id])
+        return subset_df
+
+    def average_idf(self):
+        """詞彙的平均 idf（BM25Okapi 以此處理負 idf）"""
+        if self._average_idf is None:
+            if self.idf_scope == 'global':
+                self._average_idf = self.index.average_idf()
+            else:
+                index = self.index
+                terms = np.concatenate([index.doc_terms[index.doc_indptr[p]:index.doc_indptr[p + 1]]
+                                        for p in self.positions])
+                _, df = np.unique(terms, return_counts=True)
+                idf = np.log(self.n - df + 0.5) - np.log(df + 0.5)
+                self._average_idf = float(idf.mean())
+        return self._average_idf
+
+    def okapi_term_scores(self, term_id, k1, b, epsilon):
+        """單一詞的 BM25Okapi 分數，只算含有此詞的候選文件
+
+        回傳 (doc 位置, 分數)，詞不在候選文件中時回傳 None。
+        """
+        key = (term_id, k1, b, epsilon)
+        if key in self._term_scores:
+            return self._term_scores[key]
+
+        docs, tfs, subset_df = self.hits(term_id)
+        term_scores = None
+        if subset_df:
+            df = self.doc_freq(term_id, subset_df)
+            idf = math.log(self.stats_n - df + 0.5) - math.log(df + 0.5)
+            if idf < 0:
+                idf = epsilon * self.average_idf()
+            q_freq = tfs.astype(np.int64)
+            length_norm = k1 * (1 - b + b * self.index.doc_lens[docs] / self.avgdl)
+            term_scores = (docs, idf * (q_freq * (k1 + 1) / (q_freq + length_norm)))
+        self._term_scores[key] = term_scores
+        return term_scores
+
+
+def split_passages(tokens, passage_size, overlap):
+    """將詞序列切成長度 passage_size、彼此重疊 overlap 個詞的段落"""
+    if passage_size <= 0:
+        raise ValueError(f"passage_size must be positive, got {passage_size}")
+    if not 0 <= overlap < passage_size:
+        raise ValueError(f"overlap must be in [0, passage_size), got {overlap}")
+    tokens = list(tokens)
+    stride = passage_size - overlap
+    passages = [tokens[start:start + passage_size]
+                for start in range(0, max(len(tokens) - overlap, 1), stride)]
+    return [passage for passage in passages if passage]
+
+
+class PassageIndex:
+    """段落層級的 BM25 索引
+
+    長文件切成重疊的段落分別建索引，計分時對 source 文件的所有段落計分，
+    再依 aggregate 聚合回文件：'max' 取最高段落分數，'sum' 取前 top_k 個段落分數的和。
+    """
+
+    AGGREGATES = ('max', 'sum')
+
+    def __init__(self, index, passage_doc, passage_size, overlap, meta=None):
+        self.index = index  # 以段落編號 0..P-1 為 doc id 的 BM25Index
+        self.passage_doc = np.asarray(passage_doc, dtype=np.int64)  # 段落 -> 所屬文件 id
+        self.passage_size = passage_size
+        self.overlap = overlap
+        self.meta = meta or {}
+        self._build_doc_ranges()
+
+    def _build_doc_ranges(self):
+        """每份文件的段落在索引中是連續的一段"""
+        self.doc_ids, starts, counts = np.unique(self.passage_doc, return_index=True, return_counts=True)
+        self.doc_starts = starts.astype(np.int64)
+        self.doc_counts = counts.astype(np.int64)
+        self.empty_doc_ids = np.asarray(self.meta.get('empty_doc_ids', []), dtype=np.int64)
+
+    @classmethod
+    def build(cls, docs, passage_size=256, overlap=64, meta=None, vocab=None):
+        """由 (doc_id, tokens) 序列建立段落索引"""
+        meta = dict(meta or {})
+        passage_doc = []
+        empty_doc_ids = []
+
+        def iter_passages():
+            for doc_id, tokens in docs:
+                passages = split_passages(tokens, passage_size, overlap)
+                if not passages:
+                    empty_doc_ids.append(int(doc_id))
+                for passage in passages:
+                    passage_doc.append(int(doc_id))
+                    yield len(passage_doc) - 1, passage
+
+        index = BM25Index.build(iter_passages(), meta=meta, vocab=vocab)
+        meta['empty_doc_ids'] = empty_doc_ids
+        return cls(index, passage_doc, passage_size, overlap, meta=meta)
+
+    def apply_changes(self, docs=(), removed=()):
+        """增量更新：重新切段新增或取代的文件，移除 removed 中文件的所有段落"""
+        docs = [(int(doc_id), list(tokens)) for doc_id, tokens in docs]
+        drop_docs = {int(doc_id) for doc_id in removed} | {doc_id for doc_id, _ in docs}
+        drop = np.isin(self.passage_doc, np.fromiter(drop_docs, dtype=np.int64))
+
+        passage_doc = list(self.passage_doc[~drop])
+        empty_doc_ids = [int(doc_id) for doc_id in self.empty_doc_ids if int(doc_id) not in drop_docs]
+        new_passages = []
+        next_id = len(self.index)  # 暫時的段落編號，不會與現有編號重複
+        for doc_id, tokens in docs:
+            passages = split_passages(tokens, self.passage_size, self.overlap)
+            if not passages:
+                empty_doc_ids.append(doc_id)
+            for passage in passages:
+                new_passages.append((next_id, passage))
+                passage_doc.append(doc_id)
+                next_id += 1
+
+        self.index.apply_changes(new_passages, removed=self.index.doc_ids[drop])
+        # 保留的段落維持原順序、新段落接在最後，重新編成連續的段落編號
+        self.index.doc_ids = np.arange(len(self.index.doc_ids), dtype=np.int64)
+        self.index._id_order = self.index.doc_ids.copy()
+        self.passage_doc = np.asarray(passage_doc, dtype=np.int64)
+        self.meta['empty_doc_ids'] = empty_doc_ids
+        self._build_doc_ranges()
+
+    def save(self, path):
+        """將段落索引寫入磁碟"""
+        _dump_state(path, {
+            'kind': 'passage',
+            'index': self.index.state(),
+            'passage_doc': self.passage_doc,
+            'passage_size': self.passage_size,
+            'overlap': self.overlap,
+            'meta': self.meta,
+        })
+
+    @classmethod
+    def load(cls, path):
+        """從磁碟載入段落索引"""
+        state = _load_state(path)
+        if state.get('kind') != 'passage':
+            raise ValueError(f"{path} is not a passage index")
+        return cls(BM25Index.from_state(state['index']), state['passage_doc'],
+                   state['passage_size'], state['overlap'], meta=state['meta'])
+
+    def __len__(self):
+        return len(self.doc_ids) + len(self.empty_doc_ids)
+
+    def candidates(self, source, idf_scope='subset'):
+        """建立 source 文件所有段落的候選集合"""
+        if isinstance(source, PassageCandidates):
+            return source
+        return PassageCandidates(self, source, idf_scope=idf_scope)
+
+    def get_scores(self, query_tokens, source, k1=1.5, b=0.75, epsilon=0.25, idf_scope='subset',
+                   aggregate='max', top_k=1):
+        """計算各段落的 BM25Okapi 分數後聚合回 source 文件，回傳與 source 同順序的分數"""
+        candidates = self.candidates(source, idf_scope)
+        passage_scores = self.index.get_scores(query_tokens, candidates.passages, k1=k1, b=b, epsilon=epsilon)
+        return candidates.aggregate(passage_scores, aggregate=aggregate, top_k=top_k)
+
+    def get_batch_scores(self, queries, source, k1=1.5, b=0.75, epsilon=0.25, idf_scope='subset',
+                         aggregate='max', top_k=1):
+        """同一組 source 的多個查詢一起計分，回傳 n_queries x n_candidates 的分數矩陣"""
+        candidates = self.candidates(source, idf_scope)
+        scores = np.zeros((len(queries), candidates.n))
+        for row, query_tokens in enumerate(queries):
+            scores[row] = self.get_scores(query_tokens, candidates, k1=k1, b=b, epsilon=epsilon,
+                                          aggregate=aggregate, top_k=top_k)
+        return scores
+
+    def get_top_n(self, query_tokens, source, n=1, k1=1.5, b=0.75, idf_scope='subset', aggregate='max', top_k=1):
+        """回傳分數最高的 n 個 (doc_id, score)"""
+        candidates = self.candidates(source, idf_scope)
+        scores = self.get_scores(query_tokens, candidates, k1=k1, b=b, aggregate=aggregate, top_k=top_k)
+        return rank_top_n(candidates.doc_ids, scores, n)
+
+
+class PassageCandidates:
+    """一組 source 文件展開成段落後的候選集合，段落統計量由 CandidateSet 共用"""
+
+    def __init__(self, passage_index, source, idf_scope='subset'):
+        self.doc_ids = [int(file) for file in source]
+        self.n = len(self.doc_ids)
+
+        ids = np.asarray(self.doc_ids, dtype=np.int64)
+        loc = np.searchsorted(passage_index.doc_ids, ids)
+        loc[loc == len(passage_index.doc_ids)] = 0
+        found = passage_index.doc_ids[loc] == ids if len(passage_index.doc_ids) else np.zeros(self.n, dtype=bool)
+        missing = ~found & ~np.isin(ids, passage_index.empty_doc_ids)
+        if missing.any():
+            raise KeyError(int(ids[np.argmax(missing)]))
+
+        # 沒有任何詞的文件沒有段落，分數為 0；整個索引都沒有段落時不能以 loc 取值
+        if len(passage_index.doc_ids):
+            counts = np.where(found, passage_index.doc_counts[loc], 0)
+            starts = np.where(found, passage_index.doc_starts[loc], 0)
+        else:
+            counts = starts = np.zeros(self.n, dtype=np.int64)
+        self.groups = np.repeat(np.arange(self.n), counts)
+        offsets = np.arange(len(self.groups)) - np.repeat(np.cumsum(counts) - counts, counts)
+        passage_ids = np.repeat(starts, counts) + offsets
+        self.passages = passage_index.index.candidates(passage_ids, idf_scope=idf_scope)
+
+    def aggregate(self, passage_scores, aggregate='max', top_k=1):
+        """將段落分數聚合回文件：max 或前 top_k 個段落分數的和"""
+        if aggregate not in PassageIndex.AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {aggregate}")
+        k = 1 if aggregate == 'max' else top_k
+        # 依 (文件, 分數由高到低) 排序後取每份文件的前 k 個段落
+        order = np.lexsort((-passage_scores, self.groups))
+        groups = self.groups[order]
+        first = np.searchsorted(groups, groups, side='left')
+        keep = np.arange(len(groups)) - first < k
+        return np.bincount(groups[keep], weights=passage_scores[order][keep], minlength=self.n)
@@ -6,28 +6,44 @@ from tqdm import tqdm
 import jieba
 from rank_bm25 import BM25Okapi
 
+from bm25_index import BM25Index, PassageIndex, index_path, rank_top_n
+from corpus_io import iter_corpus, iter_json_items
+from text_processing import file_hash, tokenize_parallel
+from index_updater import manifest_path, save_manifest, update_index
+from profiling import PROFILER
+
+
+CATEGORIES = ('insurance', 'finance', 'faq')
+PASSAGE_CATEGORIES = ('insurance', 'finance')  # 長篇 OCR 文件才切段落，FAQ 維持整份文件
+INCREMENTAL_CATEGORIES = ('insurance', 'finance')  # 以單一文件 JSON/TXT 檔存放，可增量更新
+CUSTOM_DICT_PATH = "custom_dict.txt"
+
 
 def init_jieba():
     """初始化jieba分詞器，載入自定義字典"""
     # 載入自定義字典
-    jieba.load_userdict("custom_dict.txt")
+    jieba.load_userdict(CUSTOM_DICT_PATH)
 
 
-def load_data(source_path, category, use_merged=True):
-    """載入參考資料，返回一個字典，key為檔案名稱，value為文本內容"""
+def merged_corpus_path(source_path, category):
+    """合併版語料的路徑（merge_json 的 NDJSON 輸出較新時改讀 .jsonl）"""
+    merged_dir = os.path.join(source_path, category, 'merged')
+    merged_path = os.path.join(merged_dir, f"merged_{category}_corpus.json")
+    jsonl_path = merged_path + 'l'
+    if os.path.exists(jsonl_path) and (not os.path.exists(merged_path)
+                                       or os.path.getmtime(jsonl_path) >= os.path.getmtime(merged_path)):
+        return jsonl_path
+    return merged_path
+
+
+def iter_data(source_path, category, use_merged=True):
+    """逐筆讀出參考資料的 (檔案名稱, 文本內容)，不會一次載入整個 JSON 檔"""
     if use_merged:
-        # 讀取合併版JSON檔
-        merged_filename = f"merged_{category}_corpus.json"
-        merged_path = os.path.join(source_path, category, 'merged', merged_filename)
-        
-        with open(merged_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            # 確保所有值都是字符串格式
-            return {int(k): str(v) for k, v in data.items()}
+        # 讀取合併版JSON檔，確保所有值都是字符串格式
+        yield from iter_corpus(merged_corpus_path(source_path, category))
     else:
         # 讀取分散的JSON檔
         category_path = os.path.join(source_path, category)
-        corpus_dict = {}
         json_files = [f for f in os.listdir(category_path) if f.endswith('.json')]
         
         for file in tqdm(json_files):
@@ -36,13 +52,32 @@ def load_data(source_path, category, use_merged=True):
             
             with open(file_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                corpus_dict[file_id] = str(data.get('text', ''))
-                
-        return corpus_dict
+                yield file_id, str(data.get('text', ''))
 
 
-def BM25_retrieve(qs, source, corpus_dict):
-    """根據查詢語句和指定的來源，檢索答案"""
+def load_data(source_path, category, use_merged=True):
+    """載入參考資料，返回一個字典，key為檔案名稱，value為文本內容"""
+    with PROFILER.stage('load'):
+        return dict(iter_data(source_path, category, use_merged=use_merged))
+
+
+def tokenize_corpus(corpus_dict, workers=1, deterministic=True):
+    """一次把整個語料分詞，回傳 {doc_id: tokens}"""
+    doc_ids = list(corpus_dict)
+    with PROFILER.stage('tokenize'):
+        tokenized = tokenize_parallel((corpus_dict[doc_id] for doc_id in doc_ids), workers=workers,
+                                      dict_path=CUSTOM_DICT_PATH, deterministic=deterministic)
+    if PROFILER.enabled:
+        PROFILER.count('corpus_tokens', sum(len(tokens) for tokens in tokenized))
+    return dict(zip(doc_ids, tokenized))
+
+
+def BM25_retrieve(qs, source, corpus_dict, n=1, return_top_n=False, tokenized_corpus=None):
+    """根據查詢語句和指定的來源，檢索答案
+
+    回傳分數最高的檔案名；return_top_n=True 時回傳前 n 個 (doc_id, score)。
+    有傳入 tokenized_corpus（預先分詞的 {doc_id: tokens}）時不再逐題分詞。
+    """
     try:
         # 確保查詢和語料庫文本都是字符串
         if isinstance(qs, bytes):
@@ -50,6 +85,7 @@ def BM25_retrieve(qs, source, corpus_dict):
         else:
             qs = str(qs)
 
+        candidate_ids = []
         filtered_corpus = []
         for file in source:
             text = corpus_dict[int(file)]
@@ -57,20 +93,29 @@ def BM25_retrieve(qs, source, corpus_dict):
                 text = text.decode('utf-8')
             else:
                 text = str(text)
+            candidate_ids.append(int(file))
             filtered_corpus.append(text)
 
         # 使用jieba進行分詞
-        tokenized_corpus = [list(jieba.cut_for_search(doc)) for doc in filtered_corpus]
-        bm25 = BM25Okapi(tokenized_corpus, b=0.5)
-        tokenized_query = list(jieba.cut_for_search(qs))
-        
-        # 獲取最相關的文檔
-        ans = bm25.get_top_n(tokenized_query, list(filtered_corpus), n=1)
-        a = ans[0]
+        if tokenized_corpus is not None:
+            tokenized_docs = [tokenized_corpus[doc_id] for doc_id in candidate_ids]
+        else:
+            with PROFILER.stage('tokenize'):
+                tokenized_docs = [list(jieba.cut_for_search(doc)) for doc in filtered_corpus]
+            if PROFILER.enabled:
+                PROFILER.count('corpus_tokens', sum(len(tokens) for tokens in tokenized_docs))
+        with PROFILER.stage('index_build'):
+            bm25 = BM25Okapi(tokenized_docs, b=0.5)
+        tokenized_query = tokenize_query(qs)
+        PROFILER.count('queries')
+        PROFILER.count('candidates_scored', len(candidate_ids))
         
-        # 找回對應的檔案名
-        res = [key for key, value in corpus_dict.items() if str(value) == str(a)]
-        return res[0]
+        # 獲取最相關的文檔，直接帶回候選的檔案名
+        with PROFILER.stage('score'):
+            scores = bm25.get_scores(tokenized_query)
+        with PROFILER.stage('rank'):
+            top_n = rank_top_n(candidate_ids, scores, n)
+        return top_n if return_top_n else top_n[0][0]
     except Exception as e:
         print(f"Error in BM25_retrieve: {str(e)}")
         print(f"Query: {type(qs)}, Source: {type(source)}")
@@ -78,53 +123,384 @@ def BM25_retrieve(qs, source, corpus_dict):
         raise
 
 
+def build_index(corpus_items, category, workers=1, deterministic=True, passage_size=0, passage_overlap=0):
+    """以 jieba 分詞一次建立 category 的倒排索引，corpus_items 為 (doc_id, text) 序列
+
+    workers > 1 時先讀出整個類別的語料，再分給多個 process 平行分詞。
+    passage_size > 0 時建立段落索引：每份文件切成 passage_size 個詞、
+    彼此重疊 passage_overlap 個詞的段落。
+    """
+    meta = {'category': category, 'tokenizer': 'cut_for_search', 'dict_hash': file_hash(CUSTOM_DICT_PATH)}
+    if workers > 1:
+        doc_ids, texts = [], []
+        for doc_id, text in corpus_items:
+            doc_ids.append(doc_id)
+            texts.append(text)
+        print(f"Tokenizing {len(texts)} {category} documents with {workers} workers")
+        with PROFILER.stage('tokenize'):
+            tokenized = tokenize_parallel(texts, workers=workers, dict_path=CUSTOM_DICT_PATH, deterministic=deterministic)
+        docs = zip(doc_ids, tokenized)
+    else:
+        docs = ((doc_id, jieba.cut_for_search(str(text))) 
+                for doc_id, text in tqdm(corpus_items, desc=f'Indexing {category}'))
+
+    # 逐篇分詞時 docs 是 generator，分詞的時間也會算在 index_build 內
+    with PROFILER.stage('index_build'):
+        if passage_size:
+            return PassageIndex.build(docs, passage_size=passage_size, overlap=passage_overlap, meta=meta)
+        return BM25Index.build(docs, meta=meta)
+
+
+def category_source_path(args, category):
+    """category 語料來源的檔案（未使用合併檔時為資料夾）"""
+    if category == 'faq':
+        return os.path.join(args.source_path, 'faq/pid_map_content.json')
+    if args.use_merged:
+        return merged_corpus_path(args.dataset_json_path, category)
+    return os.path.join(args.dataset_json_path, category)
+
+
+def source_signature(args, category):
+    """category 語料來源的路徑、mtime 與大小，存進索引的 meta，用來判斷索引是否過期
+
+    來源為資料夾時取其中 JSON 檔最新的 mtime 與大小總和。
+    """
+    path = category_source_path(args, category)
+    if os.path.isdir(path):
+        stats = [os.stat(os.path.join(path, f)) for f in os.listdir(path) if f.endswith('.json')]
+    else:
+        stats = [os.stat(path)] if os.path.exists(path) else []
+    return {
+        'source': os.path.abspath(path),
+        'source_mtime': max((stat.st_mtime for stat in stats), default=0.0),
+        'source_size': sum(stat.st_size for stat in stats)
+    }
+
+
+def iter_category_corpus(args, category):
+    """逐筆讀出 category 的參考資料，直接接到建索引"""
+    if category == 'faq':
+        return iter_corpus(category_source_path(args, category))
+    return iter_data(args.dataset_json_path, category, use_merged=args.use_merged)
+
+
+def passage_size_for(args, category):
+    """category 使用的段落長度，0 表示以整份文件建索引"""
+    if category not in PASSAGE_CATEGORIES:
+        return 0
+    return getattr(args, 'passage_size', 0) or 0
+
+
+def uses_file_index(args, category):
+    """category 是否以各文件的 JSON/TXT 檔增量更新（--update_index），而非讀取合併版語料"""
+    return getattr(args, 'update_index', False) and category in INCREMENTAL_CATEGORIES
+
+
+def category_index_path(args, category):
+    """category 索引檔的路徑，增量更新的索引與合併版語料的索引分開存放"""
+    return index_path(args.index_dir, category, passages=bool(passage_size_for(args, category)),
+                      incremental=uses_file_index(args, category))
+
+
+def build_category_index(args, category):
+    """依命令列設定讀取語料並建立 category 的索引，meta 記錄建立時的語料來源"""
+    # 先記下來源再讀取，建索引期間來源被修改時下次載入會重建
+    signature = source_signature(args, category)
+    index = build_index(iter_category_corpus(args, category), category,
+                        workers=getattr(args, 'tokenize_workers', 1),
+                        deterministic=not getattr(args, 'unordered_tokenize', False),
+                        passage_size=passage_size_for(args, category),
+                        passage_overlap=getattr(args, 'passage_overlap', 0))
+    index.meta.update(signature)
+    return index
+
+
+def stale_reason(args, category, index):
+    """索引與目前的自定義字典或語料來源不符時回傳原因，否則回傳 None
+
+    增量更新的索引沒有記錄來源（由 manifest 追蹤各文件），只檢查字典；
+    讀取合併版語料時，沒有記錄來源的索引（例如舊版本存在同一路徑的增量索引）視為過期。
+    """
+    if index.meta.get('dict_hash') != file_hash(CUSTOM_DICT_PATH):
+        return f"{CUSTOM_DICT_PATH} changed since the index was built"
+    if uses_file_index(args, category):
+        return None
+    if 'source' not in index.meta:
+        return "the index was not built from the merged corpus"
+    signature = source_signature(args, category)
+    if any(index.meta.get(key) != value for key, value in signature.items()):
+        return f"{signature['source']} changed since the index was built"
+    return None
+
+
+def load_category_index(args, category):
+    """載入 category 的索引，不存在、段落設定不同，或字典、語料在建立後被修改時回傳 None"""
+    path = category_index_path(args, category)
+    if not os.path.exists(path):
+        return None
+    passage_size = passage_size_for(args, category)
+    with PROFILER.stage('load'):
+        index = PassageIndex.load(path) if passage_size else BM25Index.load(path)
+    if passage_size and (index.passage_size, index.overlap) != (passage_size, args.passage_overlap):
+        print(f"Passage settings changed for {category}, rebuilding index")
+        return None
+    reason = stale_reason(args, category, index)
+    if reason:
+        print(f"{reason}, rebuilding {category} index")
+        return None
+    return index
+
+
+def update_category_index(args, category):
+    """依 dataset_json_path/<category>/ 下各文件的 JSON/TXT 檔增量更新索引
+
+    manifest 記錄每個檔案的 mtime、大小與內容 hash，只有新增、修改或刪除的文件
+    會重新分詞並更新索引；第一次執行（沒有 manifest）時從空索引開始建立。
+    """
+    path = category_index_path(args, category)
+    manifest_file = manifest_path(path)
+    index = load_category_index(args, category) if os.path.exists(manifest_file) else None
+    if index is None:
+        index = build_index([], category, passage_size=passage_size_for(args, category),
+                            passage_overlap=getattr(args, 'passage_overlap', 0))
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+
+    workers = getattr(args, 'tokenize_workers', 1)
+    deterministic = not getattr(args, 'unordered_tokenize', False)
+    stats, manifest = update_index(
+        index, os.path.join(args.dataset_json_path, category), manifest_file,
+        lambda texts: tokenize_parallel(texts, workers=workers, dict_path=CUSTOM_DICT_PATH,
+                                        deterministic=deterministic))
+    index.save(path)
+    save_manifest(manifest_file, manifest)
+    print(f"Updated {category} index: {stats['added']} added, {stats['changed']} changed, "
+          f"{stats['removed']} removed, {len(index)} documents")
+    return index
+
+
+def load_or_build_indexes(args, rebuild=False):
+    """從 index_dir 載入索引，不存在、段落設定不同或已過期時建立並存檔
+
+    args.update_index 為 True 時，保險與金融改以各文件的 JSON/TXT 檔增量更新。
+    """
+    indexes = {}
+    for category in CATEGORIES:
+        if uses_file_index(args, category):
+            indexes[category] = update_category_index(args, category)
+            continue
+
+        index = None if rebuild else load_category_index(args, category)
+        if index is None:
+            path = category_index_path(args, category)
+            index = build_category_index(args, category)
+            index.save(path)
+            print(f"Saved {category} index to {path}")
+        indexes[category] = index
+    return indexes
+
+
+def tokenize_query(qs):
+    """將查詢語句以 jieba 分詞"""
+    if isinstance(qs, bytes):
+        qs = qs.decode('utf-8')
+    with PROFILER.stage('tokenize'):
+        tokens = list(jieba.cut_for_search(str(qs)))
+    PROFILER.count('query_tokens', len(tokens))
+    return tokens
+
+
+def BM25_retrieve_from_index(qs, source, index, b=0.5, n=1, return_top_n=False, idf_scope='subset'):
+    """直接從預建索引對 source 子集合計分，檢索答案"""
+    tokens = tokenize_query(qs)
+    PROFILER.count('queries')
+    PROFILER.count('candidates_scored', len(source))
+    with PROFILER.stage('score'):
+        top_n = index.get_top_n(tokens, source, n=n, b=b, idf_scope=idf_scope)
+    return top_n if return_top_n else top_n[0][0]
+
+
+def group_questions(questions):
+    """依 (category, source) 將題目分組，回傳 {key: [題目位置, ...]}"""
+    groups = {}
+    for i, q_dict in enumerate(questions):
+        key = (q_dict['category'], tuple(int(file) for file in q_dict['source']))
+        groups.setdefault(key, []).append(i)
+    return groups
+
+
+def retrieve_batch(questions, indexes, b=0.5, n=1, return_top_n=False, idf_scope='subset',
+                   aggregate='max', top_k=1):
+    """批次檢索多個題目
+
+    依類別與 source 分組，同一組的子集合統計量與各詞分數只算一次，
+    整組查詢一起計分成一個矩陣。回傳值依 questions 的順序，與逐題檢索相同。
+    idf_scope='global' 時改用整個類別預先算好的 N、df、avgdl。
+    段落索引的分數依 aggregate（max 或前 top_k 段落的 sum）聚合回文件。
+    """
+    for q_dict in questions:
+        if q_dict['category'] not in indexes:
+            raise ValueError(f"Unknown category: {q_dict['category']}")
+
+    results = [None] * len(questions)
+    for (category, source), members in group_questions(questions).items():
+        index = indexes[category]
+        queries = [tokenize_query(questions[i]['query']) for i in members]
+        PROFILER.count('queries', len(members))
+        PROFILER.count('candidates_scored', len(members) * len(source))
+        with PROFILER.stage('score'):
+            candidates = index.candidates(source, idf_scope)
+            if isinstance(index, PassageIndex):
+                scores = index.get_batch_scores(queries, candidates, b=b, aggregate=aggregate, top_k=top_k)
+            else:
+                scores = index.get_batch_scores(queries, candidates, b=b)
+        with PROFILER.stage('rank'):
+            for i, row in zip(members, scores):
+                top_n = rank_top_n(candidates.doc_ids, row, n)
+                results[i] = top_n if return_top_n else top_n[0][0]
+    return results
+
+
+def report_profile(args):
+    """依命令列設定印出並寫出各階段的計時"""
+    if PROFILER.enabled:
+        PROFILER.report()
+        PROFILER.save(args.profile_json, args.profile_prom)
+
+
+def format_answer(qid, top_n, include_top_n=False):
+    """組成參賽格式的答案，include_top_n 時附上前 n 名的 [doc_id, score]"""
+    answer = {"qid": qid, "retrieve": top_n[0][0]}
+    if include_top_n:
+        answer["top_n"] = [[doc_id, score] for doc_id, score in top_n]
+    return answer
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Process some paths and files.')
-    parser.add_argument('--question_path', type=str, required=True, help='讀取發布題目路徑')
-    parser.add_argument('--source_path', type=str, required=True, help='讀取參考資料路徑')
-    parser.add_argument('--output_path', type=str, required=True, help='輸出符合參賽格式的答案路徑')
+    parser.add_argument('--question_path', type=str, help='讀取發布題目路徑')
+    parser.add_argument('--source_path', type=str, help='讀取參考資料路徑')
+    parser.add_argument('--output_path', type=str, help='輸出符合參賽格式的答案路徑')
     parser.add_argument('--use_merged', type=bool, default=True, help='是否使用合併版JSON檔')
     parser.add_argument('--dataset_json_path', type=str, 
                        default='/Users/harperdelaviga/dataset_json',
                        help='JSON檔案路徑')
+    parser.add_argument('--index_dir', type=str, default=None,
+                       help='預建倒排索引目錄，指定後直接從索引檢索')
+    parser.add_argument('--build_index', action='store_true',
+                       help='只(重新)建立索引後結束')
+    parser.add_argument('--update_index', action='store_true',
+                       help='依 dataset_json_path 下各文件的 JSON/TXT 檔增量更新保險與金融索引')
+    parser.add_argument('--top_n', type=int, default=None,
+                       help='在答案中附上前 N 名的 [doc_id, score]')
+    parser.add_argument('--idf_scope', choices=['subset', 'global'], default='subset',
+                       help='以 source 子集合或整個類別計算 idf 與平均長度（global 需搭配 --index_dir）')
+    parser.add_argument('--tokenize_workers', type=int, default=1,
+                       help='平行分詞的 process 數')
+    parser.add_argument('--passage_size', type=int, default=0,
+                       help='保險與金融文件切成此長度（詞數）的段落建索引，0 表示以整份文件建索引')
+    parser.add_argument('--passage_overlap', type=int, default=64,
+                       help='相鄰段落重疊的詞數')
+    parser.add_argument('--passage_aggregate', choices=['max', 'sum'], default='max',
+                       help='段落分數聚合回文件的方式')
+    parser.add_argument('--passage_top_k', type=int, default=2,
+                       help='passage_aggregate=sum 時加總的段落數')
+    parser.add_argument('--unordered_tokenize', action='store_true',
+                       help='長文件切段並依完成順序收集分詞結果（較快，不保證與逐篇分詞完全相同）')
+    parser.add_argument('--profile', action='store_true',
+                       help='記錄 load、tokenize、index_build、score、rank 各階段的時間並印出摘要')
+    parser.add_argument('--profile_json', type=str, default=None,
+                       help='將各階段計時與計數器寫成 JSON（隱含 --profile）')
+    parser.add_argument('--profile_prom', type=str, default=None,
+                       help='將各階段計時與計數器寫成 Prometheus text format（隱含 --profile）')
 
     args = parser.parse_args()
+    PROFILER.enable(args.profile or bool(args.profile_json) or bool(args.profile_prom))
 
     # 初始化jieba，載入自定義字典
+    if args.passage_size and not 0 <= args.passage_overlap < args.passage_size:
+        parser.error('--passage_overlap must be in [0, --passage_size)')
+
     init_jieba()
 
+    if args.build_index:
+        if not args.index_dir:
+            parser.error('--build_index requires --index_dir')
+        load_or_build_indexes(args, rebuild=True)
+        report_profile(args)
+        raise SystemExit(0)
+    if args.update_index:
+        if not args.index_dir:
+            parser.error('--update_index requires --index_dir')
+        if not args.question_path:
+            load_or_build_indexes(args)
+            report_profile(args)
+            raise SystemExit(0)
+    if not args.question_path or not args.output_path:
+        parser.error('--question_path and --output_path are required')
+    if args.idf_scope == 'global' and not args.index_dir:
+        parser.error('--idf_scope global requires --index_dir')
+    if args.passage_size and not args.index_dir:
+        parser.error('--passage_size requires --index_dir')
+
     answer_dict = {"answers": []}
+    n = args.top_n or 1
+    include_top_n = args.top_n is not None
 
     with open(args.question_path, 'rb') as f:
         qs_ref = json.load(f)
 
-    # 讀取保險和金融資料
-    corpus_dict_insurance = load_data(args.dataset_json_path, 'insurance', use_merged=args.use_merged)
-    corpus_dict_finance = load_data(args.dataset_json_path, 'finance', use_merged=args.use_merged)
+    if args.index_dir:
+        # 直接從預建索引檢索，不需載入語料與重新分詞
+        indexes = load_or_build_indexes(args)
 
-    # 讀取FAQ資料
-    with open(os.path.join(args.source_path, 'faq/pid_map_content.json'), 'rb') as f_s:
-        key_to_source_dict = json.load(f_s)
-        key_to_source_dict = {int(key): value for key, value in key_to_source_dict.items()}
+        results = retrieve_batch(qs_ref['questions'], indexes, n=n, return_top_n=True, idf_scope=args.idf_scope,
+                                 aggregate=args.passage_aggregate, top_k=args.passage_top_k)
+        for q_dict, top_n in zip(qs_ref['questions'], results):
+            answer_dict['answers'].append(format_answer(q_dict['qid'], top_n, include_top_n))
 
-    for q_dict in qs_ref['questions']:
-        if q_dict['category'] == 'finance':
-            retrieved = BM25_retrieve(q_dict['query'], q_dict['source'], corpus_dict_finance)
-            answer_dict['answers'].append({"qid": q_dict['qid'], "retrieve": retrieved})
+    else:
+        # 讀取保險和金融資料
+        corpus_dict_insurance = load_data(args.dataset_json_path, 'insurance', use_merged=args.use_merged)
+        corpus_dict_finance = load_data(args.dataset_json_path, 'finance', use_merged=args.use_merged)
 
-        elif q_dict['category'] == 'insurance':
-            retrieved = BM25_retrieve(q_dict['query'], q_dict['source'], corpus_dict_insurance)
-            answer_dict['answers'].append({"qid": q_dict['qid'], "retrieve": retrieved})
+        # 讀取FAQ資料
+        faq_path = os.path.join(args.source_path, 'faq/pid_map_content.json')
+        with PROFILER.stage('load'):
+            key_to_source_dict = {int(key): value for key, value in iter_json_items(faq_path)}
 
-        elif q_dict['category'] == 'faq':
-            corpus_dict_faq = {key: str(value) for key, value in key_to_source_dict.items() 
-                             if key in q_dict['source']}
-            retrieved = BM25_retrieve(q_dict['query'], q_dict['source'], corpus_dict_faq)
-            answer_dict['answers'].append({"qid": q_dict['qid'], "retrieve": retrieved})
+        # 平行分詞時先把整個語料分詞一次，各題直接取用
+        tokenized = {'insurance': None, 'finance': None, 'faq': None}
+        if args.tokenize_workers > 1:
+            deterministic = not args.unordered_tokenize
+            tokenized['insurance'] = tokenize_corpus(corpus_dict_insurance, args.tokenize_workers, deterministic)
+            tokenized['finance'] = tokenize_corpus(corpus_dict_finance, args.tokenize_workers, deterministic)
+            tokenized['faq'] = tokenize_corpus({key: str(value) for key, value in key_to_source_dict.items()},
+                                               args.tokenize_workers, deterministic)
 
-        else:
-            raise ValueError("Something went wrong")
+        for q_dict in qs_ref['questions']:
+            if q_dict['category'] == 'finance':
+                top_n = BM25_retrieve(q_dict['query'], q_dict['source'], corpus_dict_finance, n=n,
+                                      return_top_n=True, tokenized_corpus=tokenized['finance'])
+                answer_dict['answers'].append(format_answer(q_dict['qid'], top_n, include_top_n))
+
+            elif q_dict['category'] == 'insurance':
+                top_n = BM25_retrieve(q_dict['query'], q_dict['source'], corpus_dict_insurance, n=n,
+                                      return_top_n=True, tokenized_corpus=tokenized['insurance'])
+                answer_dict['answers'].append(format_answer(q_dict['qid'], top_n, include_top_n))
+
+            elif q_dict['category'] == 'faq':
+                corpus_dict_faq = {key: str(value) for key, value in key_to_source_dict.items() 
+                                 if key in q_dict['source']}
+                top_n = BM25_retrieve(q_dict['query'], q_dict['source'], corpus_dict_faq, n=n,
+                                      return_top_n=True, tokenized_corpus=tokenized['faq'])
+                answer_dict['answers'].append(format_answer(q_dict['qid'], top_n, include_top_n))
+
+            else:
+                raise ValueError("Something went wrong")
 
     # 將答案字典保存為json文件
     with open(args.output_path, 'w', encoding='utf8') as f:
-        json.dump(answer_dict, f, ensure_ascii=False, indent=4)
\ No newline at end of file
+        json.dump(answer_dict, f, ensure_ascii=False, indent=4)
+
+    report_profile(args)
\ No newline at end of file
@@ -1,26 +1,52 @@
 import os
-import math
-import datetime
 import json
 import argparse
 from tqdm import tqdm
 import jieba
-from rank_bm25 import BM25Okapi
+import random
 import itertools
+import multiprocessing
+
+from bm25_index import BM25Index, Vocabulary, rank_top_n
+from corpus_io import load_corpus_dict, open_document_store
+from evaluation import GroundTruth, evaluate
+from text_processing import TokenCache, SynonymExpander, StopwordFilter, tokenize_parallel
+from tracing import Tracer, json_default
+from profiling import PROFILER, CAPTURE_MODES, capture
+from param_search import SEARCH_MODES, Budget, BudgetExhausted, SearchSpace, successive_halving, bayesian_search
+
+# 平行 grid search 時由 fork 出的 worker 共用的 tuner
+_WORKER_TUNER = None
+
+
+def _evaluate_in_worker(param_dict):
+    """在 worker process 中評估一組參數，連同這組參數的階段計時一起回傳"""
+    PROFILER.reset()
+    result = _WORKER_TUNER.evaluate_parameters(param_dict)
+    return result, PROFILER.summary()
+
 
 class BM25Tuner:
-    def __init__(self, data_dir, dataset_json_path, use_custom_dict=False, use_synonyms=False, synonyms_dir=None, use_stopwords=False, stopwords_path=None):
+    def __init__(self, data_dir, dataset_json_path, use_custom_dict=False, use_synonyms=False, synonyms_dir=None, use_stopwords=False, stopwords_path=None, token_cache_dir=None, doc_store_dir=None, tokenize_workers=1, deterministic_tokenize=True, idf_scope='subset', output_top_n=False, tracer=None):
         self.data_dir = data_dir
         self.dataset_json_path = dataset_json_path
         self.output_path = os.path.join(os.getcwd(), 'output_answers.json')
+        self.doc_store_dir = doc_store_dir
+        self.tokenize_workers = tokenize_workers
+        self.deterministic_tokenize = deterministic_tokenize
+        self.output_top_n = output_top_n  # 答案中是否附上前 n 名的 (doc_id, score)
+        self.idf_scope = idf_scope  # 'subset'：以 source 子集合計算 N/df/avgdl；'global'：整個類別
+        self.tracer = tracer or Tracer()  # 預設關閉，不寫出任何追蹤記錄
         self.best_params = None
         self.best_accuracy = 0
         self.results = []
+        self._prepared_queries = {}
 
         # 停用詞相關設定
         self.use_stopwords = use_stopwords
         self.stopwords_path = stopwords_path
         self.stopwords = set()
+        self.stopword_filter = StopwordFilter(self.stopwords)
         if use_stopwords:
             self.load_stopwords()
 
@@ -28,12 +54,20 @@ class BM25Tuner:
         self.use_synonyms = use_synonyms
         self.synonyms_dir = synonyms_dir
         self.synonyms = {}
+        self.synonym_expander = None
+        self._missing_synonym_categories = set()
         if use_synonyms:
             self.load_synonyms()
         
-        # 初始化 jieba 自定義字典
+        # 初始化 jieba 自定義字典（平行分詞的 worker 各自載入同一份字典）
+        self.dict_path = 'custom_dict.txt' if use_custom_dict else None
         if use_custom_dict:
             self.init_jieba()
+
+        # 分詞快取：依自定義字典版本分檔
+        self.token_cache = None
+        if token_cache_dir:
+            self.token_cache = TokenCache(token_cache_dir, dict_path=self.dict_path)
         
         print("Loading all data...")
         self.load_json_data()
@@ -89,26 +123,15 @@ class BM25Tuner:
         except Exception as e:
             print(f"Error loading stopwords: {str(e)}")
 
+        self.stopword_filter = StopwordFilter(self.stopwords, getattr(self, 'synonyms', None))
+
     def remove_stopwords(self, tokens):
         """移除停用詞，但保留同義詞中的重要詞"""
         if not self.use_stopwords:
             return tokens
         
-        #TODO: 去除空格
-        tokens = [token for token in tokens if token.strip()]
-        
-        # 獲取所有同義詞
-        all_synonyms = set()
-        for category in self.synonyms:
-            for word in self.synonyms[category]:
-                all_synonyms.add(word)
-                all_synonyms.update(self.synonyms[category][word].get("synonyms", []))
-        
-        # 過濾停用詞，但保留同義詞
-        filtered_tokens = [token for token in tokens 
-                        if token not in self.stopwords or token in all_synonyms]
-        
-        return filtered_tokens
+        # 去除空格並過濾停用詞；同義詞在編譯過濾器時已從停用詞中扣除
+        return self.stopword_filter(tokens)
 
     def read_synonyms_from_file(self, file_path):
         """讀取同義詞字典文件"""
@@ -135,6 +158,12 @@ class BM25Tuner:
             print(f"Loaded synonyms from {synonym_file_path}")
         else:
             print(f"Warning: Synonym file not found at {synonym_file_path}")
+
+        # 編譯成 trie 並快取擴展結果；同義詞變了，停用詞過濾器與已準備好的查詢也要重算
+        self.synonym_expander = SynonymExpander(self.synonyms, path=synonym_file_path)
+        self.stopword_filter = StopwordFilter(self.stopwords, self.synonyms)
+        self._missing_synonym_categories = set()
+        self._prepared_queries = {}
         
 
     def _load_synonym_file(self, file_path):
@@ -156,73 +185,18 @@ class BM25Tuner:
     
     def expand_query_with_weight(self, query, category):
         """擴展查詢字串，加入同義詞並賦予權重"""
-        # print(f"\nDebug - Original query: {query}")
-         #print(f"Category: {category}")
-        
         if not self.synonyms or category not in self.synonyms:
-            print("No synonyms found for this category")
+            if category not in self._missing_synonym_categories:
+                print(f"No synonyms found for category: {category}")
+                self._missing_synonym_categories.add(category)
             return query, {}
 
-        words = list(jieba.cut_for_search(query))
-        # print(f"Tokenized query: {words}")
-        expanded_words = []
-        weight_dict = {}
-        used_synonyms = set()
-        
-        i = 0
-        while i < len(words):
-            # 先嘗試匹配較長的詞組
-            found_phrase = False
-            for j in range(min(3, len(words) - i), 0, -1):
-                phrase = ''.join(words[i:i+j])
-                if phrase in self.synonyms[category]:
-                    if phrase not in used_synonyms:
-                        # 獲取詞組資訊
-                        phrase_data = self.synonyms[category][phrase]
-                        weight = phrase_data["weight"]
-                        
-                        # 添加原詞組
-                        expanded_words.append(phrase)
-                        weight_dict[phrase] = weight
-                        used_synonyms.add(phrase)
-                        
-                        # 添加同義詞
-                        for syn in phrase_data["synonyms"]:
-                            if syn not in used_synonyms:
-                                expanded_words.append(syn)
-                                weight_dict[syn] = weight
-                                used_synonyms.add(syn)
-                                
-                    i += j
-                    found_phrase = True
-                    break
-            
-            # 如果沒找到詞組，處理單個詞
-            if not found_phrase:
-                word = words[i]
-                if word not in used_synonyms:
-                    expanded_words.append(word)
-                    
-                    # 檢查是否有同義詞
-                    if word in self.synonyms[category]:
-                        word_data = self.synonyms[category][word]
-                        weight = word_data["weight"]
-                        weight_dict[word] = weight
-                        
-                        # 添加同義詞
-                        for syn in word_data["synonyms"]:
-                            if syn not in used_synonyms:
-                                expanded_words.append(syn)
-                                weight_dict[syn] = weight
-                                used_synonyms.add(syn)
-                                
-                    used_synonyms.add(word)
-                i += 1
-
-        expanded_query = ' '.join(expanded_words)
-        # print(f"Expanded query: {expanded_query}")
-        # print(f"Weight dict: {weight_dict}")
-        return expanded_query, weight_dict
+        with PROFILER.stage('expand'):
+            # 同義詞檔修改後重新載入
+            if self.synonym_expander.is_stale():
+                self.load_synonyms()
+
+            return self.synonym_expander.expand(query, category)
 
     def init_jieba(self):
         """初始化 jieba 分詞器"""
@@ -262,21 +236,26 @@ class BM25Tuner:
                 # questions_path = os.path.join(self.data_dir, 'dataset', 'preliminary', 'extra_question.json')
                 # ground_truth_path = os.path.join(self.data_dir, 'dataset', 'preliminary', 'extra_ground_truth.json')
 
-                # 載入資料
-                with open(insurance_path, 'r', encoding='utf-8') as f:
-                    self.corpus_dict_insurance = {int(k): str(v) for k, v in json.load(f).items()}
+                with PROFILER.stage('load'):
+                    # 載入資料（逐筆串流讀取，原始文字只保留一份）
+                    if self.doc_store_dir:
+                        # 文字放在 mmap 的文件庫中，需要時才切出
+                        self.corpus_dict_insurance = open_document_store(self.doc_store_dir, 'insurance', insurance_path)
+                        self.corpus_dict_finance = open_document_store(self.doc_store_dir, 'finance', finance_path)
+                        self.key_to_source_dict = open_document_store(self.doc_store_dir, 'faq', faq_path)
+                    else:
+                        self.corpus_dict_insurance = load_corpus_dict(insurance_path)
+                        self.corpus_dict_finance = load_corpus_dict(finance_path)
+                        self.key_to_source_dict = load_corpus_dict(faq_path)
 
-                with open(finance_path, 'r', encoding='utf-8') as f:
-                    self.corpus_dict_finance = {int(k): str(v) for k, v in json.load(f).items()}
+                    with open(questions_path, 'r', encoding='utf-8') as f:
+                        self.questions = json.load(f)
 
-                with open(faq_path, 'r', encoding='utf-8') as f:
-                    self.key_to_source_dict = {int(k): str(v) for k, v in json.load(f).items()}
+                    with open(ground_truth_path, 'r', encoding='utf-8') as f:
+                        self.ground_truth = json.load(f)
 
-                with open(questions_path, 'r', encoding='utf-8') as f:
-                    self.questions = json.load(f)
-                    
-                with open(ground_truth_path, 'r', encoding='utf-8') as f:
-                    self.ground_truth = json.load(f)
+                    # 以 qid 建立標準答案與題目的索引，評估時不需逐題線性搜尋
+                    self.gt_index = GroundTruth(self.ground_truth, self.questions)
 
                 # 初始化 tokenized corpus
                 self._init_tokenized_corpus()
@@ -288,25 +267,71 @@ class BM25Tuner:
                 raise
 
 
+    def tokenize(self, text):
+        """以 jieba 搜尋引擎模式分詞，有設定快取時先查快取"""
+        if self.token_cache is not None:
+            return self.token_cache.tokenize(text)
+        return list(jieba.cut_for_search(text))
+
+    def tokenize_all(self, texts):
+        """批次分詞整個語料，tokenize_workers > 1 時分給多個 process
+
+        逐篇分詞時回傳 generator，以 tokenize 邊讀邊分詞。
+        """
+        if self.tokenize_workers <= 1:
+            return (self.tokenize(str(text)) for text in texts)
+        if self.token_cache is not None:
+            return self.token_cache.tokenize_many(texts, workers=self.tokenize_workers,
+                                                  deterministic=self.deterministic_tokenize)
+        return tokenize_parallel(texts, workers=self.tokenize_workers, dict_path=self.dict_path,
+                                 deterministic=self.deterministic_tokenize)
+
     def _init_tokenized_corpus(self):
-        """初始化並處理 tokenized corpus"""
+        """初始化並處理 tokenized corpus
+
+        每份文件存成 int32 term id 陣列，三個類別共用同一份詞彙表；
+        停用詞在整個語料分詞完後以 term id 遮罩一次過濾。
+        """
+        self.vocabulary = Vocabulary()
         self.tokenized_corpus = {
             'insurance': {},
             'finance': {},
             'faq': {}
         }
-        
-        for doc_id, content in self.corpus_dict_insurance.items():
-            tokens = list(jieba.cut_for_search(content))
-            self.tokenized_corpus['insurance'][doc_id] = self.remove_stopwords(tokens)
-        
-        for doc_id, content in self.corpus_dict_finance.items():
-            tokens = list(jieba.cut_for_search(content))
-            self.tokenized_corpus['finance'][doc_id] = self.remove_stopwords(tokens)
-            
-        for doc_id, content in self.key_to_source_dict.items():
-            tokens = list(jieba.cut_for_search(str(content)))
-            self.tokenized_corpus['faq'][doc_id] = self.remove_stopwords(tokens)
+        corpora = {
+            'insurance': self.corpus_dict_insurance,
+            'finance': self.corpus_dict_finance,
+            'faq': self.key_to_source_dict
+        }
+
+        # 三個類別的文件一起分詞，結果依原本的 doc 順序編碼；
+        # 文字以 generator 逐篇讀出（文件庫只在分詞時才解碼單一文件），不先收集成 list
+        keys = [(category, doc_id) for category, corpus in corpora.items() for doc_id in corpus]
+        texts = (content for corpus in corpora.values() for _, content in corpus.items())
+        with PROFILER.stage('tokenize'):
+            tokenized = self.tokenize_all(texts)
+            for (category, doc_id), tokens in zip(keys, tokenized):
+                self.tokenized_corpus[category][doc_id] = self.vocabulary.encode(tokens)
+        if PROFILER.enabled:
+            PROFILER.count('corpus_tokens', sum(len(term_ids) for docs in self.tokenized_corpus.values()
+                                                for term_ids in docs.values()))
+
+        if self.use_stopwords:
+            keep = self.stopword_filter.mask(self.vocabulary)
+            for docs in self.tokenized_corpus.values():
+                for doc_id, term_ids in docs.items():
+                    docs[doc_id] = term_ids[keep[term_ids]]
+
+        if self.token_cache is not None:
+            print(f"Token cache: {self.token_cache.hits} hits, {self.token_cache.misses} misses")
+            self.token_cache.save()
+
+        # 每個類別建立一個索引（CSR term-document 矩陣），供加權計分使用
+        with PROFILER.stage('index_build'):
+            self.indexes = {
+                category: BM25Index.from_token_ids(docs.items(), self.vocabulary, meta={'category': category})
+                for category, docs in self.tokenized_corpus.items()
+            }
 
 
     def check_file_exists(self, file_path, description):
@@ -318,246 +343,264 @@ class BM25Tuner:
                                 f"Dataset JSON path: {self.dataset_json_path}")
         return True
 
-    def BM25_retrieve(self, qs, source, category, k1=1.5, b=0.75, n=1):
-        """使用 BM25 算法檢索文檔"""
-        expanded_query, weight_dict = self.expand_query_with_weight(qs, category)
-        
+    def corpus_dict(self, category):
+        """回傳 category 對應的語料字典"""
         if category == 'finance':
-            tokenized_docs = [self.tokenized_corpus['finance'][int(file)] for file in source]
-            filtered_corpus = [self.corpus_dict_finance[int(file)] for file in source]
+            return self.corpus_dict_finance
         elif category == 'insurance':
-            tokenized_docs = [self.tokenized_corpus['insurance'][int(file)] for file in source]
-            filtered_corpus = [self.corpus_dict_insurance[int(file)] for file in source]
-        else:  # faq
-            tokenized_docs = [self.tokenized_corpus['faq'][int(file)] for file in source]
-            filtered_corpus = [str(self.key_to_source_dict[int(file)]) for file in source]
-
-        bm25 = BM25Okapi(tokenized_docs, k1=k1, b=b)
-        query_tokens = list(jieba.cut_for_search(expanded_query))
-        
-        # 應用權重到 BM25 分數
-        doc_scores = bm25.get_scores(query_tokens)
-        
-        # 調整分數以考慮同義詞權重
-        if weight_dict:
-            for i, score in enumerate(doc_scores):
-                weight_sum = sum(weight_dict.get(token, 1.0) for token in query_tokens 
-                            if token in ' '.join(tokenized_docs[i]))
-                doc_scores[i] = score * weight_sum
-        
-        best_idx = sorted(range(len(doc_scores)), key=lambda i: doc_scores[i], reverse=True)[:n]
-        best_doc = filtered_corpus[best_idx[0]]
-        
-        # 返回對應的文件 ID
-        if category == 'finance':
-            res = [key for key, value in self.corpus_dict_finance.items() if value == best_doc]
-        elif category == 'insurance':
-            res = [key for key, value in self.corpus_dict_insurance.items() if value == best_doc]
-        else:  # faq
-            res = [key for key, value in self.key_to_source_dict.items() if str(value) == best_doc]
+            return self.corpus_dict_insurance
+        return self.key_to_source_dict
+
+    def BM25_retrieve(self, qs, source, category, k1=1.5, b=0.75, n=1, return_top_n=False):
+        """使用 BM25 算法檢索文檔"""
+        expanded_query, weight_dict = self.expand_query_with_weight(qs, category)
         
-        return res[0]
+        candidate_ids = [int(file) for file in source]
+        with PROFILER.stage('tokenize'):
+            query_tokens = list(jieba.cut_for_search(expanded_query))
+        PROFILER.count('queries')
+        PROFILER.count('query_tokens', len(query_tokens))
+        PROFILER.count('candidates_scored', len(candidate_ids))
+        
+        with PROFILER.stage('score'):
+            # 應用權重到 BM25 分數（與 BM25Okapi 相同，以候選子集合的統計量計分）
+            doc_scores = self.indexes[category].get_scores(query_tokens, candidate_ids, k1=k1, b=b, idf_scope=self.idf_scope)
+
+            # 調整分數以考慮同義詞權重
+            if weight_dict:
+                for i, score in enumerate(doc_scores):
+                    doc_text = ' '.join(self.vocabulary.decode(self.tokenized_corpus[category][candidate_ids[i]]))
+                    weight_sum = sum(weight_dict.get(token, 1.0) for token in query_tokens 
+                                if token in doc_text)
+                    doc_scores[i] = score * weight_sum
+        
+        # 直接返回候選的文件 ID
+        with PROFILER.stage('rank'):
+            top_n = rank_top_n(candidate_ids, doc_scores, n)
+        return top_n if return_top_n else top_n[0][0]
     
-    def BM25_retrieve_with_weight(self, qs, source, category, k1=1.5, b=0.75, n=1):
-        """使用加權 BM25 算法檢索文檔"""
-        log_filename = "bm25_debug.log"
-        with open(log_filename, 'a', encoding='utf-8') as log_file:
-            log_file.write("\n" + "="*50 + "\n")
-            log_file.write(f"Timestamp: {datetime.datetime.now()}\n\n")
-            
-            # 獲取擴展查詢和權重
+    def prepare_queries(self, questions):
+        """依 (category, source) 分組預先準備所有題目，同組題目共用候選文件的子集合"""
+        groups = {}
+        for q_dict in questions:
+            key = (q_dict['category'], tuple(int(file) for file in q_dict['source']))
+            groups.setdefault(key, []).append(q_dict)
+
+        for (category, source), group in groups.items():
+            candidates = self.indexes[category].candidates(source, self.idf_scope)
+            for q_dict in group:
+                self.prepare_query(q_dict['query'], source, category, candidates=candidates)
+
+    def prepare_query(self, qs, source, category, candidates=None):
+        """擴展、分詞並計算與 k1、b 無關的查詢統計量，每個 (query, source, category) 只算一次"""
+        key = (qs, tuple(int(file) for file in source), category)
+        prepared = self._prepared_queries.get(key)
+        if prepared is None:
             expanded_query, weight_dict = self.expand_query_with_weight(qs, category)
-            
-            log_file.write(f"Original query: {qs}\n")
-            log_file.write(f"Category: {category}\n")
-            log_file.write(f"Expanded query: {expanded_query}\n")
-            log_file.write(f"Weight dictionary: {json.dumps(weight_dict, ensure_ascii=False, indent=2)}\n\n")
-
-            # 選擇相應的語料庫
-            if category == 'finance':
-                tokenized_docs = [self.tokenized_corpus['finance'][int(file)] for file in source]
-                filtered_corpus = [self.corpus_dict_finance[int(file)] for file in source]
-            elif category == 'insurance':
-                tokenized_docs = [self.tokenized_corpus['insurance'][int(file)] for file in source]
-                filtered_corpus = [self.corpus_dict_insurance[int(file)] for file in source]
-            else:  # faq
-                tokenized_docs = [self.tokenized_corpus['faq'][int(file)] for file in source]
-                filtered_corpus = [str(self.key_to_source_dict[int(file)]) for file in source]
-
-            # 創建 BM25 實例
-            bm25 = BM25Okapi(tokenized_docs, k1=k1, b=b)
-            
-            # 對查詢進行分詞並應用權重
-            query_tokens = list(jieba.cut_for_search(expanded_query))
-            query_tokens = self.remove_stopwords(query_tokens)
-            
-            # 記錄查詢詞和權重
-            log_file.write("Query Analysis:\n")
-            log_file.write(f"Query tokens (after stopwords removal): {query_tokens}\n")
-            
-            # 創建加權查詢向量
-            weighted_query = []
-            query_weights = []
-            for token in query_tokens:
-                weight = weight_dict.get(token, 1.0)  # 默認權重為1.0
-                weighted_query.append(token)
-                query_weights.append(weight)
-                log_file.write(f"Token: {token}, Weight: {weight}\n")
-            
-            # 獲取基礎 BM25 分數
-            base_scores = bm25.get_scores(weighted_query)
-            
-            # 應用權重到文檔評分
-            weighted_scores = []
-            log_file.write("\nDocument Scoring Details:\n")
-            
-            for doc_idx, base_score in enumerate(base_scores):
-                doc_tokens = tokenized_docs[doc_idx]
-                log_file.write(f"\nDocument {doc_idx}:\n")
-                log_file.write(f"Content preview: {' '.join(doc_tokens[:50])}...\n")
-                
-                weighted_score = 0
-                token_matches = []
-                
-                # 計算每個查詢詞的加權分數
-                for q_token, q_weight in zip(weighted_query, query_weights):
-                    # 計算當前token在文檔中的頻率(tf)
-                    tf = sum(1 for token in doc_tokens if token == q_token)
-                    
-                    # 計算文檔頻率(df)
-                    df = sum(1 for doc in tokenized_docs if q_token in doc)
-                    
-                    # 計算 IDF
-                    N = len(tokenized_docs)
-                    idf = math.log((N - df + 0.5) / (df + 0.5) + 1.0)
-                    
-                    # 計算文檔長度標準化因子
-                    doc_len = len(doc_tokens)
-                    avg_doc_len = sum(len(doc) for doc in tokenized_docs) / len(tokenized_docs)
-                    norm_factor = 1 - b + b * (doc_len / avg_doc_len)
-                    
-                    # 計算該詞的 BM25 分數
-                    term_score = (tf * (k1 + 1)) / (tf + k1 * norm_factor) * idf
-                    
-                    # 應用權重
-                    weighted_term_score = term_score * q_weight
-                    weighted_score += weighted_term_score
-                    
-                    if term_score > 0:
-                        token_matches.append({
-                            'token': q_token,
-                            'weight': q_weight,
-                            'tf': tf,
-                            'idf': idf,
-                            'base_score': term_score,
-                            'weighted_score': weighted_term_score
-                        })
-                
-                # 記錄評分細節
-                log_file.write("Term matching details:\n")
-                for match in token_matches:
-                    log_file.write(f"  - Token: {match['token']}\n")
-                    log_file.write(f"    Weight: {match['weight']}\n")
-                    log_file.write(f"    TF: {match['tf']}\n")
-                    log_file.write(f"    IDF: {match['idf']:.4f}\n")
-                    log_file.write(f"    Base score: {match['base_score']:.4f}\n")
-                    log_file.write(f"    Weighted score: {match['weighted_score']:.4f}\n")
-                
-                log_file.write(f"Base score: {base_score:.4f}\n")
-                log_file.write(f"Final weighted score: {weighted_score:.4f}\n")
-                log_file.write("-" * 40 + "\n")
-                
-                weighted_scores.append(weighted_score)
-
-            # 選擇最佳文檔
-            best_idx = sorted(range(len(weighted_scores)), key=lambda i: weighted_scores[i], reverse=True)[:n]
-            best_doc = filtered_corpus[best_idx[0]]
-            
-            # 返回對應的文件 ID
-            if category == 'finance':
-                res = [key for key, value in self.corpus_dict_finance.items() if value == best_doc]
-            elif category == 'insurance':
-                res = [key for key, value in self.corpus_dict_insurance.items() if value == best_doc]
-            else:  # faq
-                res = [key for key, value in self.key_to_source_dict.items() if str(value) == best_doc]
-            
-            log_file.write(f"\nSelected document ID: {res[0]}\n")
-            log_file.write(f"Selected document content: {best_doc[:200]}...\n")
-            log_file.write("=" * 50 + "\n\n")
+            with PROFILER.stage('tokenize'):
+                query_tokens = self.remove_stopwords(list(jieba.cut_for_search(expanded_query)))
+            PROFILER.count('query_tokens', len(query_tokens))
+            query_weights = [weight_dict.get(token, 1.0) for token in query_tokens]  # 默認權重為1.0
+            with PROFILER.stage('prepare'):
+                stats = self.indexes[category].prepare_weighted(query_tokens, query_weights, candidates or source,
+                                                                 idf_scope=self.idf_scope)
+            prepared = (expanded_query, weight_dict, query_tokens, query_weights, stats)
+            self._prepared_queries[key] = prepared
+        return prepared
+
+    def BM25_retrieve_with_weight(self, qs, source, category, k1=1.5, b=0.75, n=1, return_top_n=False):
+        """使用加權 BM25 算法檢索文檔"""
+        # 獲取擴展查詢、權重與候選文件統計量（換 k1、b 時沿用）
+        expanded_query, weight_dict, query_tokens, query_weights, stats = self.prepare_query(qs, source, category)
+        candidate_ids = stats.doc_ids
+        PROFILER.count('queries')
+        PROFILER.count('candidates_scored', len(candidate_ids))
+
+        # 只需重算 BM25 的飽和函數
+        with PROFILER.stage('score'):
+            weighted_scores = stats.scores(k1=k1, b=b)
+
+        # 選擇最佳文檔，直接返回候選的文件 ID
+        with PROFILER.stage('rank'):
+            top_n = rank_top_n(candidate_ids, weighted_scores, n)
+        return top_n if return_top_n else top_n[0][0]
+
+    def explain_query(self, qs, source, category, k1=1.5, b=0.75, n=1):
+        """加權 BM25 的計分說明：擴展查詢、各詞權重，以及每份候選文件各詞的 tf、idf 與分數"""
+        expanded_query, weight_dict, query_tokens, query_weights, stats = self.prepare_query(qs, source, category)
+        candidate_ids = stats.doc_ids
+        weighted_scores = stats.scores(k1=k1, b=b)
+        top_n = rank_top_n(candidate_ids, weighted_scores, n)
+
+        index = self.indexes[category]
+        base_scores = index.get_scores(query_tokens, candidate_ids, k1=k1, b=b, idf_scope=self.idf_scope)
+        terms = [index.terms[term_id] for term_id in stats.term_ids]
+        tf = stats.tf
+        # 各詞的飽和值（weighted_scores 為其乘上 idf 與權重的和）
+        saturated = stats.saturated(k1=k1, b=b)
+
+        documents = []
+        for doc_idx, doc_id in enumerate(candidate_ids):
+            doc_tokens = self.vocabulary.decode(self.tokenized_corpus[category][doc_id][:50])
+            row = slice(tf.indptr[doc_idx], tf.indptr[doc_idx + 1])
+            documents.append({
+                'doc_id': doc_id,
+                'preview': ' '.join(doc_tokens),
+                'terms': [{
+                    'token': terms[col],
+                    'weight': stats.weights[col],
+                    'tf': count,
+                    'idf': stats.idf[col],
+                    'base_score': term_score * stats.idf[col],
+                    'weighted_score': term_score * stats.coef[col]
+                } for col, count, term_score in zip(tf.indices[row], tf.data[row], saturated.data[row])],
+                'base_score': base_scores[doc_idx],
+                'weighted_score': weighted_scores[doc_idx]
+            })
 
-        return res[0]
+        best_id = top_n[0][0]
+        return {
+            'query': qs,
+            'category': category,
+            'expanded_query': expanded_query,
+            'weights': weight_dict,
+            'query_tokens': [[token, weight] for token, weight in zip(query_tokens, query_weights)],
+            'params': {'k1': k1, 'b': b},
+            'documents': documents,
+            'top_n': [[doc_id, score] for doc_id, score in top_n],
+            'selected': best_id,
+            'selected_content': str(self.corpus_dict(category)[best_id])[:200]
+        }
 
-    def evaluate_parameters(self, params):
-        """Evaluate performance for given parameter set"""
+    def explain(self, qid, k1=1.5, b=0.75, n=1):
+        """依 qid 產生該題的計分說明，並附上標準答案"""
+        question = self.gt_index.question(qid)
+        if question is None:
+            raise KeyError(f"Unknown qid: {qid}")
+        explanation = self.explain_query(question['query'], question['source'], question['category'], k1=k1, b=b, n=n)
+        gt_answer = self.gt_index.get(qid)
+        explanation['qid'] = qid
+        explanation['expected'] = gt_answer['retrieve'] if gt_answer else None
+        return explanation
+
+    def _trace_query(self, q_dict, params, top_n):
+        """答錯的題目（error 以上）與取樣到的題目（debug）記錄完整說明，info 只記錄結果摘要"""
+        qid = q_dict['qid']
+        if not self.tracer.enabled('error', qid):
+            return
+        gt_answer = self.gt_index.get(qid)
+        expected = gt_answer['retrieve'] if gt_answer else None
+        correct = expected == top_n[0][0]
+        if not correct or self.tracer.enabled('debug'):
+            explanation = self.explain(qid, k1=params['k1'], b=params['b'], n=params['n'])
+            self.tracer.emit('explain', correct=correct, **explanation)
+        elif self.tracer.enabled('info'):
+            self.tracer.emit('query', qid=qid, category=q_dict['category'], params=params, correct=correct,
+                             expected=expected, top_n=[[doc_id, score] for doc_id, score in top_n])
+
+    def evaluate_parameters(self, params, questions=None, ground_truth=None):
+        """Evaluate performance for given parameter set
+
+        questions / ground_truth 預設為全部題目；successive halving 以題目子集合評估。
+        """
+        questions = self.questions['questions'] if questions is None else questions
+        ground_truth = self.gt_index if ground_truth is None else ground_truth
         answer_dict = {"answers": []}
         
-        for q_dict in self.questions['questions']:
-            retrieved = self.BM25_retrieve_with_weight( # BM25_retrieve_with_weight | BM25_retrieve
+        for q_dict in questions:
+            top_n = self.BM25_retrieve_with_weight( # BM25_retrieve_with_weight | BM25_retrieve
                 q_dict['query'], 
                 q_dict['source'], 
                 q_dict['category'],
                 k1=params['k1'],
                 b=params['b'],
-                n=params['n']
+                n=params['n'],
+                return_top_n=True
             )
             
             answer_dict['answers'].append({
                 "qid": q_dict['qid'],
-                "retrieve": retrieved
+                "retrieve": top_n[0][0],
+                "top_n": [[doc_id, score] for doc_id, score in top_n]
             })
+            self._trace_query(q_dict, params, top_n)
+        # fork 出的 worker 結束時不會執行 atexit，每組參數評估完就寫出
+        self.tracer.flush()
+
+        # accuracy 只看第一名；MRR 與 recall@k 依前 n 名的排序計算
+        metrics = evaluate(answer_dict['answers'], ground_truth)
+
+        # 只有指定 --output_top_n 時才在答案中保留候選清單（供之後的 reranker 使用）
+        if not self.output_top_n:
+            for answer in answer_dict['answers']:
+                del answer['top_n']
+        return metrics['accuracy'], answer_dict, metrics
+
+    def _evaluate_all(self, combinations, workers=1):
+        """依序產出每組參數的 (accuracy, answer_dict, metrics)；workers > 1 時以 process pool 平行評估"""
+        if workers <= 1:
+            for param_dict in combinations:
+                yield self.evaluate_parameters(param_dict)
+            return
 
-        # Calculate accuracy
-        correct_count = 0
-        total_count = len(self.ground_truth['ground_truths'])
-
-        for output_answer in answer_dict['answers']:
-            qid = output_answer['qid']
-            retrieve = output_answer['retrieve']
-            gt_answer = next((item for item in self.ground_truth['ground_truths'] if item['qid'] == qid), None)
-            if gt_answer and gt_answer['retrieve'] == retrieve:
-                correct_count += 1
-
-        accuracy = correct_count / total_count
-        return accuracy, answer_dict
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            print("Warning: fork is not available on this platform, falling back to a single worker")
+            yield from self._evaluate_all(combinations, workers=1)
+            return
 
-    def grid_search(self, param_grid):
+        # fork 出的 worker 以 copy-on-write 共用已分詞的語料與索引，不需重新分詞
+        global _WORKER_TUNER
+        _WORKER_TUNER = self
+        self.tracer.flush()  # 避免 fork 後各 worker 重複寫出同一份緩衝
+        try:
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                # imap 依提交順序回傳結果，讓 best 參數的選擇與單核執行一致
+                for result, profile in pool.imap(_evaluate_in_worker, combinations):
+                    PROFILER.merge(profile)
+                    yield result
+        finally:
+            _WORKER_TUNER = None
+
+    def grid_search(self, param_grid, workers=1):
         """Perform grid search for parameter tuning"""
         print("\nStarting grid search...")
-        total_combinations = len(list(itertools.product(*param_grid.values())))
+        combinations = [dict(zip(param_grid.keys(), params)) for params in itertools.product(*param_grid.values())]
+        total_combinations = len(combinations)
         print(f"Total parameter combinations to test: {total_combinations}")
+        if workers > 1:
+            print(f"Evaluating with {workers} workers")
+
+        # 每題的擴展查詢與候選統計量只算一次，之後每組參數只重算 BM25 飽和函數
+        self.prepare_queries(self.questions['questions'])
         
-        for params in tqdm(itertools.product(*param_grid.values()), total=total_combinations):
-            param_dict = dict(zip(param_grid.keys(), params))
-            accuracy, answer_dict = self.evaluate_parameters(param_dict)
-            
+        best_answer_dict = None
+        results = self._evaluate_all(combinations, workers)
+        for param_dict, (accuracy, answer_dict, metrics) in tqdm(zip(combinations, results), total=total_combinations):
             self.results.append({
                 'params': param_dict,
-                'accuracy': accuracy
+                'accuracy': accuracy,
+                'mrr': metrics['mrr'],
+                'recall': metrics['recall'],
+                'per_category': {category: stats['accuracy'] for category, stats in metrics['per_category'].items()}
             })
 
-            if accuracy > self.best_accuracy:
+            # 第一組參數一定先當作最佳結果，全部 accuracy 都是 0 時仍會寫出答案並做錯誤分析
+            if best_answer_dict is None or accuracy > self.best_accuracy:
                 self.best_accuracy = accuracy
                 self.best_params = param_dict
+                best_answer_dict = answer_dict
                 # Save best results
                 with open(self.output_path, 'w', encoding='utf8') as f:
                     json.dump(answer_dict, f, ensure_ascii=False, indent=4)
 
             print(f"\nParameters: {param_dict}")
-            print(f"Accuracy: {accuracy:.2%}")
+            print(f"Accuracy: {accuracy:.2%}, MRR: {metrics['mrr']:.4f}")
 
         print("\nGrid search completed!")
         print(f"Best parameters: {self.best_params}")
         print(f"Best accuracy: {self.best_accuracy:.2%}")
 
         # 對最佳結果進行錯誤分析
-        best_answer_dict = None
-        for result in self.results:
-            if result['accuracy'] == self.best_accuracy:
-                # 重新運行最佳參數來獲取答案
-                best_params = result['params']
-                best_answer_dict = self.evaluate_parameters(best_params)[1]
-                break
-        
         if best_answer_dict:
             self.analyze_errors(best_answer_dict)
 
@@ -569,6 +612,100 @@ class BM25Tuner:
                 'all_results': self.results
             }, f, ensure_ascii=False, indent=4)
     
+    def search(self, space, mode='halving', budget=None, seed=42, eta=3, n_candidates=27, max_iter=50,
+               checkpoint_path='parameter_search_results.json', resume=False):
+        """以 successive halving 或貝氏最佳化搜尋參數，每次評估後寫出 checkpoint
+
+        resume=True 時讀回 checkpoint 中已評估過的 (參數, 題數)，以相同的 seed 重跑搜尋時
+        直接沿用結果、不重新評估。預算用完時以目前最好的參數結束。
+        預算只計算本次執行新做的評估（沿用 checkpoint 的結果不計），時間也從本次執行開始算，
+        所以續跑時 budget 代表「再多做多少」。
+        """
+        budget = budget or Budget()
+        questions = self.questions['questions']
+        self.prepare_queries(questions)
+        # 子集合為固定 seed 打亂後的前 n 題，同一個 seed 的每一輪與每次續跑都一致
+        order = list(questions)
+        random.Random(seed).shuffle(order)
+        search_info = {'mode': mode, 'seed': seed, 'space': space.spec, 'questions': len(questions)}
+
+        cache = {}
+        if resume and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            same_seed = checkpoint.get('search', {}).get('seed') == seed
+            for result in checkpoint.get('all_results', []):
+                size = result.get('questions', len(questions))
+                # 不同 seed 的子集合不同，只能沿用全部題目的結果
+                if size == len(questions) or same_seed:
+                    self.results.append(result)
+                    cache[(json.dumps(result['params'], sort_keys=True), size)] = result
+            print(f"Resuming from {checkpoint_path}: {len(cache)} evaluations reused")
+
+        def save_checkpoint():
+            with open(checkpoint_path, 'w', encoding='utf8') as f:
+                json.dump({
+                    'best_params': self.best_params,
+                    'best_accuracy': self.best_accuracy,
+                    'search': search_info,
+                    'all_results': self.results
+                }, f, ensure_ascii=False, indent=4)
+
+        def evaluate_point(params, size):
+            key = (json.dumps(params, sort_keys=True), size)
+            result = cache.get(key)
+            if result is None:
+                budget.spend()
+                subset = order[:size]
+                ground_truth = GroundTruth([self.gt_index.get(q['qid']) for q in subset if self.gt_index.get(q['qid'])],
+                                           subset)
+                accuracy, _, metrics = self.evaluate_parameters(params, subset, ground_truth)
+                result = {
+                    'params': params,
+                    'accuracy': accuracy,
+                    'questions': size,
+                    'mrr': metrics['mrr'],
+                    'recall': metrics['recall'],
+                    'per_category': {category: stats['accuracy'] for category, stats in metrics['per_category'].items()}
+                }
+                self.results.append(result)
+                cache[key] = result
+                print(f"Parameters: {params}, questions: {size}, accuracy: {accuracy:.2%}")
+            # 只有全部題目的結果可以當作最佳參數
+            if size == len(questions) and result['accuracy'] > self.best_accuracy:
+                self.best_accuracy = result['accuracy']
+                self.best_params = params
+            save_checkpoint()
+            return result['accuracy']
+
+        print(f"\nStarting {mode} search...")
+        try:
+            if mode == 'halving':
+                successive_halving(evaluate_point, space, len(questions), n_candidates=n_candidates, eta=eta, seed=seed)
+            else:
+                bayesian_search(evaluate_point, space, len(questions), max_iter=max_iter, seed=seed)
+        except BudgetExhausted:
+            print(f"\nBudget exhausted after {budget.evals} evaluations")
+
+        if self.best_params is None and self.results:
+            # 預算在最後一輪之前用完：取題數最多的一輪中最好的參數
+            best = max(self.results, key=lambda result: (result.get('questions', 0), result['accuracy']))
+            self.best_params = best['params']
+        if self.best_params is None:
+            print("No parameters evaluated")
+            return
+
+        # 以最佳參數在全部題目上評估一次，寫出答案並做錯誤分析（不計入預算）
+        self.best_accuracy, answer_dict, _ = self.evaluate_parameters(self.best_params)
+        with open(self.output_path, 'w', encoding='utf8') as f:
+            json.dump(answer_dict, f, ensure_ascii=False, indent=4)
+        save_checkpoint()
+
+        print(f"\n{mode} search completed!")
+        print(f"Best parameters: {self.best_params}")
+        print(f"Best accuracy: {self.best_accuracy:.2%}")
+        self.analyze_errors(answer_dict)
+
     def analyze_errors(self, answer_dict):
         """分析錯誤案例"""
         print("\n=== Error Analysis ===")
@@ -579,24 +716,16 @@ class BM25Tuner:
             predicted = output_answer['retrieve']
             
             # 找到對應的ground truth
-            gt_answer = next((item for item in self.ground_truth['ground_truths'] if item['qid'] == qid), None)
+            gt_answer = self.gt_index.get(qid)
             if gt_answer and gt_answer['retrieve'] != predicted:
                 # 找到原始問題
-                question = next((q for q in self.questions['questions'] if q['qid'] == qid), None)
+                question = self.gt_index.question(qid)
                 
                 if question:
                     # 獲取預測文本和正確文本
-                    predicted_text = ""
-                    correct_text = ""
-                    if question['category'] == 'finance':
-                        predicted_text = self.corpus_dict_finance.get(predicted, "Not found")
-                        correct_text = self.corpus_dict_finance.get(gt_answer['retrieve'], "Not found")
-                    elif question['category'] == 'insurance':
-                        predicted_text = self.corpus_dict_insurance.get(predicted, "Not found")
-                        correct_text = self.corpus_dict_insurance.get(gt_answer['retrieve'], "Not found")
-                    else:  # faq
-                        predicted_text = self.key_to_source_dict.get(predicted, "Not found")
-                        correct_text = self.key_to_source_dict.get(gt_answer['retrieve'], "Not found")
+                    corpus_dict = self.corpus_dict(question['category'])
+                    predicted_text = corpus_dict.get(predicted, "Not found")
+                    correct_text = corpus_dict.get(gt_answer['retrieve'], "Not found")
                     
                     errors.append({
                         'qid': qid,
@@ -650,15 +779,117 @@ def main():
     parser.add_argument("--stopwords_path",
                        default="stopwords.txt",
                        help="Path to stopwords file")
+    parser.add_argument("--token_cache_dir",
+                       default=None,
+                       help="Directory for the on-disk tokenization cache (disabled if not set)")
+    parser.add_argument("--doc_store_dir",
+                       default=None,
+                       help="Directory for the memory-mapped document store (texts are loaded into memory if not set)")
+    parser.add_argument("--workers",
+                       type=int,
+                       default=1,
+                       help="Number of processes for parallel grid search")
+    parser.add_argument("--tokenize_workers",
+                       type=int,
+                       default=1,
+                       help="Number of processes for parallel corpus tokenization")
+    parser.add_argument("--idf_scope",
+                       choices=["subset", "global"],
+                       default="subset",
+                       help="Compute N/df/avgdl over each question's source subset or over the whole category")
+    parser.add_argument("--output_top_n",
+                       action="store_true",
+                       help="Include the top n (doc_id, score) pairs per question in the answers (n from the parameter grid)")
+    parser.add_argument("--unordered_tokenize",
+                       action="store_true",
+                       help="Split long documents and collect tokenization results as they finish (faster, not guaranteed identical to serial)")
+    parser.add_argument("--trace_path",
+                       default="bm25_trace.jsonl",
+                       help="JSONL file for structured query traces")
+    parser.add_argument("--trace_level",
+                       choices=["off", "error", "info", "debug"],
+                       default="off",
+                       help="error: explain wrongly answered questions; info: also one summary line per question; debug: explain every sampled question")
+    parser.add_argument("--trace_sample",
+                       type=float,
+                       default=1.0,
+                       help="Fraction of questions to trace, chosen deterministically by qid")
+    parser.add_argument("--trace_qids",
+                       type=int,
+                       nargs="+",
+                       default=None,
+                       help="Only trace these qids (overrides --trace_sample)")
+    parser.add_argument("--explain",
+                       type=int,
+                       nargs="+",
+                       default=None,
+                       help="After the search, write scoring explanations for these qids with the best parameters to explanations.json")
+    parser.add_argument("--search",
+                       choices=SEARCH_MODES,
+                       default="grid",
+                       help="grid: full Cartesian product of param_grid; halving: successive halving on question subsets; bayes: Gaussian-process Bayesian optimization")
+    parser.add_argument("--budget_evals",
+                       type=int,
+                       default=None,
+                       help="Maximum number of new evaluations for --search halving/bayes (evaluations reused by --resume are not counted)")
+    parser.add_argument("--budget_seconds",
+                       type=float,
+                       default=None,
+                       help="Maximum wall-clock seconds of this run for --search halving/bayes")
+    parser.add_argument("--n_candidates",
+                       type=int,
+                       default=27,
+                       help="Number of sampled configurations in the first successive-halving rung")
+    parser.add_argument("--eta",
+                       type=int,
+                       default=3,
+                       help="Successive halving keeps 1/eta of the candidates per rung")
+    parser.add_argument("--max_iter",
+                       type=int,
+                       default=50,
+                       help="Maximum number of Bayesian optimization steps")
+    parser.add_argument("--seed",
+                       type=int,
+                       default=42,
+                       help="Random seed for sampling configurations and question subsets")
+    parser.add_argument("--resume",
+                       action="store_true",
+                       help="Reuse evaluations checkpointed in parameter_search_results.json")
+    parser.add_argument("--profile",
+                       action="store_true",
+                       help="Time each stage (load, tokenize, expand, index_build, prepare, score, rank) and print a summary")
+    parser.add_argument("--profile_json",
+                       default=None,
+                       help="Write the stage timings and counters as JSON (implies --profile)")
+    parser.add_argument("--profile_prom",
+                       default=None,
+                       help="Write the stage timings and counters in Prometheus text format (implies --profile)")
+    parser.add_argument("--profile_capture",
+                       choices=CAPTURE_MODES,
+                       default=None,
+                       help="Profile a single grid point with cProfile or pyinstrument instead of running the full search")
+    parser.add_argument("--profile_params",
+                       default=None,
+                       help='Grid point for --profile_capture as JSON, e.g. \'{"k1": 1.2, "b": 0.75, "n": 1}\' (default: first grid point)')
+    parser.add_argument("--profile_output",
+                       default=None,
+                       help="Output file for --profile_capture (default: profile.prof or profile.html)")
     args = parser.parse_args()
+    PROFILER.enable(args.profile or bool(args.profile_json) or bool(args.profile_prom))
 
     # Load configuration
+    config = {}
     try:
         with open(args.config, 'r', encoding='utf-8') as f:
             config = json.load(f)
-        param_grid = config['param_grid']
-        print("Loaded parameter grid from config file:")
-        print(json.dumps(param_grid, indent=2))
+        # halving/bayes 的設定檔可以只有 search_space，param_grid 只有 grid search 一定需要
+        param_grid = config.get('param_grid')
+        if param_grid:
+            print("Loaded parameter grid from config file:")
+            print(json.dumps(param_grid, indent=2))
+        if config.get('search_space'):
+            print("Loaded search space from config file:")
+            print(json.dumps(config['search_space'], indent=2))
     except FileNotFoundError:
         print(f"Config file {args.config} not found, using default parameters")
         param_grid = {
@@ -674,6 +905,15 @@ def main():
             'n': [1, 2]
         }
 
+    if not param_grid:
+        if args.profile_capture:
+            if not args.profile_params:
+                parser.error(f"{args.config} has no param_grid; pass --profile_params for --profile_capture")
+        elif args.search == 'grid':
+            parser.error(f"{args.config} has no param_grid, which --search grid requires")
+        elif not config.get('search_space'):
+            parser.error(f"{args.config} has neither search_space nor param_grid")
+
     # Print configuration
     print("\nRunning with configuration:")
     print(f"Data directory: {args.data_dir}")
@@ -692,7 +932,14 @@ def main():
             use_synonyms=args.use_synonyms,
             synonyms_dir=args.synonyms_dir if args.use_synonyms else None,
             use_stopwords=args.use_stopwords,
-            stopwords_path=args.stopwords_path if args.use_stopwords else None
+            stopwords_path=args.stopwords_path if args.use_stopwords else None,
+            token_cache_dir=args.token_cache_dir,
+            doc_store_dir=args.doc_store_dir,
+            tokenize_workers=args.tokenize_workers,
+            deterministic_tokenize=not args.unordered_tokenize,
+            idf_scope=args.idf_scope,
+            output_top_n=args.output_top_n,
+            tracer=Tracer(args.trace_path, level=args.trace_level, sample_rate=args.trace_sample, qids=args.trace_qids)
         )
 
         # TODO: test only 添加停用詞測試
@@ -707,9 +954,36 @@ def main():
             tuner.test_stopwords(text)
         """
         
-        # Run grid search
+        if args.profile_capture:
+            # 只對單一組參數做函式層級的 profiling
+            if args.profile_params:
+                params = json.loads(args.profile_params)
+            else:
+                params = dict(zip(param_grid.keys(), next(itertools.product(*param_grid.values()))))
+            print(f"\nProfiling grid point {params} with {args.profile_capture}...")
+
+            def run_grid_point():
+                # 與 grid_search 相同：先準備所有題目，再以這組參數評估
+                tuner.prepare_queries(tuner.questions['questions'])
+                return tuner.evaluate_parameters(params)
+
+            accuracy, _, _ = capture(run_grid_point, args.profile_capture, args.profile_output)
+            print(f"Accuracy: {accuracy:.2%}")
+            if PROFILER.enabled:
+                PROFILER.report()
+                PROFILER.save(args.profile_json, args.profile_prom)
+            return
+
         print("\nStarting parameter tuning...")
-        tuner.grid_search(param_grid)
+        if args.search == 'grid':
+            # Run grid search
+            tuner.grid_search(param_grid, workers=args.workers)
+        else:
+            # search_space 可為連續範圍；沒有設定時以 param_grid 的離散選項為空間
+            space = SearchSpace(config.get('search_space') or param_grid)
+            tuner.search(space, mode=args.search, budget=Budget(args.budget_evals, args.budget_seconds),
+                         seed=args.seed, eta=args.eta, n_candidates=args.n_candidates, max_iter=args.max_iter,
+                         resume=args.resume)
         
         # Print final results
         print("\nTuning completed!")
@@ -718,6 +992,17 @@ def main():
         print(f"Results saved to: {tuner.output_path}")
         print("Error analysis saved to: error_analysis.json")
         print("Parameter search results saved to: parameter_search_results.json")
+
+        if args.explain and tuner.best_params:
+            explanations = [tuner.explain(qid, k1=tuner.best_params['k1'], b=tuner.best_params['b'],
+                                          n=tuner.best_params['n']) for qid in args.explain]
+            with open('explanations.json', 'w', encoding='utf-8') as f:
+                json.dump(explanations, f, ensure_ascii=False, indent=2, default=json_default)
+            print("Scoring explanations saved to: explanations.json")
+
+        if PROFILER.enabled:
+            PROFILER.report()
+            PROFILER.save(args.profile_json, args.profile_prom)
         
     except Exception as e:
         print("\nError during execution:")
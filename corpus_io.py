@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import mmap
+from collections.abc import Mapping
+
+import numpy as np
+
+try:
+    import ijson
+except ImportError:  # ijson 為選用套件，沒有安裝時使用標準函式庫的逐段解析
+    ijson = None
+
+
+_WHITESPACE = re.compile(r'\s*')
+_NUMBER_CHARS = '0123456789+-.eE'
+
+
+class _JSONStream:
+    """以固定大小逐段讀取 JSON 文字，一次只保留目前正在解析的值"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self, size):
+        """丟掉已解析的部分並讀入下一段，已到檔尾時回傳 False"""
+        if self.eof:
+            return False
+        chunk = self.f.read(size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return bool(chunk)
+
+    def peek(self):
+        """回傳下一個非空白字元（不消耗），檔尾回傳空字串"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_more(self.chunk_size):
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        """解析下一個完整的 JSON 值；值被切斷時繼續讀入，讀取量每次加倍"""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # 數字被切在緩衝區結尾時（例如 "1." 或 "12"）可能還沒讀完
+                if self.eof or (end < len(self.buffer) and self.buffer[end] not in _NUMBER_CHARS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read_more(size)
+            size *= 2
+
+
+def _iter_json_items_stdlib(path, chunk_size):
+    with open(path, 'r', encoding='utf-8') as f:
+        stream = _JSONStream(f, chunk_size)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            yield key, stream.value()
+
+            separator = stream.peek()
+            stream.pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"Expected ',' or '}}' in {path}, found {separator!r}")
+
+
+def _iter_jsonl_items(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield from json.loads(line).items()
+
+
+def iter_json_items(path, chunk_size=1 << 16):
+    """逐筆讀出 JSON 檔最外層物件的 (key, value)，不會把整個檔案載入記憶體
+
+    .jsonl 檔（每行一個物件，例如 merge_json 的 NDJSON 輸出）逐行讀出每行物件的 (key, value)。
+    """
+    if path.endswith('.jsonl'):
+        yield from _iter_jsonl_items(path)
+    elif ijson is not None:
+        with open(path, 'rb') as f:
+            yield from ijson.kvitems(f, '', use_float=True)
+    else:
+        yield from _iter_json_items_stdlib(path, chunk_size)
+
+
+def iter_corpus(path):
+    """逐筆讀出語料檔的 (doc_id, text)，可直接接到分詞與建索引"""
+    for key, value in iter_json_items(path):
+        yield int(key), str(value)
+
+
+def load_corpus_dict(path):
+    """載入語料為 {doc_id: text}，原始文字只在記憶體中保留一份"""
+    return dict(iter_corpus(path))
+
+
+class DocumentStore(Mapping):
+    """以 mmap 讀取的文件庫
+
+    所有文字存成一個 UTF-8 blob，另存 doc id 與 offset 表；讀取時只切出需要的文件，
+    不需解析 JSON，多個 process 也共用同一份 page cache。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.doc_ids = np.load(path + '.ids.npy', mmap_mode='r')
+        self.offsets = np.load(path + '.offsets.npy', mmap_mode='r')
+        self._order = np.argsort(self.doc_ids, kind='stable')
+
+        with open(path + '.blob', 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._blob = b''
+
+    @classmethod
+    def build(cls, path, items):
+        """將 (doc_id, text) 序列寫成 blob 與 offset 表"""
+        doc_ids = []
+        offsets = [0]
+        with open(path + '.blob', 'wb') as f:
+            for doc_id, text in items:
+                data = str(text).encode('utf-8')
+                f.write(data)
+                doc_ids.append(int(doc_id))
+                offsets.append(offsets[-1] + len(data))
+
+        np.save(path + '.ids.npy', np.array(doc_ids, dtype=np.int64))
+        np.save(path + '.offsets.npy', np.array(offsets, dtype=np.int64))
+        return cls(path)
+
+    def _position(self, doc_id):
+        try:
+            doc_id = int(doc_id)
+        except (TypeError, ValueError):
+            raise KeyError(doc_id)
+        i = np.searchsorted(self.doc_ids, doc_id, sorter=self._order)
+        if i < len(self._order) and self.doc_ids[self._order[i]] == doc_id:
+            return self._order[i]
+        raise KeyError(doc_id)
+
+    def __getitem__(self, doc_id):
+        position = self._position(doc_id)
+        return self._blob[self.offsets[position]:self.offsets[position + 1]].decode('utf-8')
+
+    def __iter__(self):
+        for doc_id in self.doc_ids:
+            yield int(doc_id)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def items(self):
+        """依寫入順序逐筆讀出 (doc_id, text)"""
+        for position, doc_id in enumerate(self.doc_ids):
+            yield int(doc_id), self._blob[self.offsets[position]:self.offsets[position + 1]].decode('utf-8')
+
+
+def open_document_store(store_dir, name, source_path):
+    """開啟 store_dir 中的文件庫，不存在或比來源 JSON 舊時重新建立"""
+    path = os.path.join(store_dir, name)
+    if (not os.path.exists(path + '.offsets.npy')
+            or os.path.getmtime(path + '.offsets.npy') < os.path.getmtime(source_path)):
+        os.makedirs(store_dir, exist_ok=True)
+        print(f"Building document store {path} from {source_path}")
+        return DocumentStore.build(path, iter_corpus(source_path))
+    return DocumentStore(path)
@@ -0,0 +1,98 @@
+import numpy as np
+
+
+class GroundTruth:
+    """以 qid 建立索引的標準答案與題目，只建立一次，之後每次查詢都是 O(1)"""
+
+    def __init__(self, ground_truths, questions=None):
+        if isinstance(ground_truths, dict):
+            ground_truths = ground_truths['ground_truths']
+        if isinstance(questions, dict):
+            questions = questions['questions']
+        self.items = list(ground_truths)
+        self.by_qid = {item['qid']: item for item in self.items}
+        self.questions = {q['qid']: q for q in questions or []}
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, qid):
+        """qid 的標準答案，沒有時回傳 None"""
+        return self.by_qid.get(qid)
+
+    def question(self, qid):
+        """qid 的原始題目，沒有時回傳 None"""
+        return self.questions.get(qid)
+
+    def category(self, qid):
+        """qid 的類別：優先取標準答案中的 category，其次取題目的"""
+        item = self.by_qid.get(qid) or self.questions.get(qid) or {}
+        return item.get('category', 'Unknown')
+
+
+def ranked_ids(answers, k=None):
+    """將答案轉成 n_answers x k 的 doc id 矩陣，依 top_n（沒有時只用 retrieve），不足處補 -1"""
+    rankings = [[doc_id for doc_id, _ in answer['top_n']] if 'top_n' in answer else [answer['retrieve']]
+                for answer in answers]
+    width = max((len(ranking) for ranking in rankings), default=1)
+    width = max(width if k is None else min(width, k), 1)
+    matrix = np.full((len(rankings), width), -1, dtype=np.int64)
+    for row, ranking in enumerate(rankings):
+        ranking = ranking[:width]
+        matrix[row, :len(ranking)] = ranking
+    return matrix
+
+
+def evaluate(answers, ground_truth, ks=(1, 3, 5)):
+    """計算 accuracy、各類別 accuracy、MRR 與 recall@k
+
+    answers 為 [{qid, retrieve, (top_n)}]；分母皆為標準答案的題數（與原本的 accuracy 相同）。
+    """
+    if not isinstance(ground_truth, GroundTruth):
+        ground_truth = GroundTruth(ground_truth)
+    total = len(ground_truth)
+
+    qids = [answer['qid'] for answer in answers]
+    gt_items = [ground_truth.get(qid) for qid in qids]
+    # 找不到標準答案的題目用 -2，不會與任何 doc id 或補位的 -1 相等
+    expected = np.array([item['retrieve'] if item else -2 for item in gt_items], dtype=np.int64)
+    ranked = ranked_ids(answers)
+
+    hits = ranked == expected[:, None]
+    correct = hits[:, 0]
+    found = hits.any(axis=1)
+    first_rank = np.argmax(hits, axis=1)
+    reciprocal = np.where(found, 1.0 / (first_rank + 1), 0.0)
+
+    # 各類別：分母為該類別的標準答案題數，分子以 bincount 一次算出
+    names, totals = np.unique([item.get('category', 'Unknown') for item in ground_truth.items], return_counts=True)
+    lookup = {name: i for i, name in enumerate(names)}
+    answer_categories = np.array([lookup.get(ground_truth.category(qid), -1) for qid in qids], dtype=np.int64)
+    valid = correct & (answer_categories >= 0)
+    correct_by_category = np.bincount(answer_categories[valid], minlength=len(names))
+    per_category = {
+        str(name): {
+            'correct': int(correct_by_category[i]),
+            'total': int(totals[i]),
+            'accuracy': int(correct_by_category[i]) / int(totals[i])
+        }
+        for i, name in enumerate(names)
+    }
+
+    correct_count = int(np.count_nonzero(correct))
+    incorrect = [{
+        'qid': qids[row],
+        'output_retrieve': answers[row]['retrieve'],
+        'ground_truth_retrieve': gt_items[row]['retrieve'] if gt_items[row] else 'Not found',
+        'category': gt_items[row]['category'] if gt_items[row] else 'Unknown'
+    } for row in np.flatnonzero(~correct)]
+
+    return {
+        'correct': correct_count,
+        'total': total,
+        'accuracy': correct_count / total if total > 0 else 0,
+        'mrr': float(reciprocal.sum()) / total if total > 0 else 0,
+        'recall': {k: int(np.count_nonzero(hits[:, :k].any(axis=1))) / total if total > 0 else 0 for k in ks},
+        'per_category': per_category,
+        'incorrect': incorrect
+    }
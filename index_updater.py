@@ -0,0 +1,101 @@
+import os
+import json
+
+from text_processing import file_hash
+
+
+def manifest_path(index_file):
+    """索引檔對應的 manifest 路徑"""
+    return index_file + '.manifest.json'
+
+
+def load_manifest(path):
+    """載入 manifest：{doc_id: {檔名: {mtime_ns, size, hash}}}，不存在時回傳 None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return {int(doc_id): files for doc_id, files in json.load(f).items()}
+
+
+def save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({str(doc_id): files for doc_id, files in sorted(manifest.items())}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def scan_documents(category_dir):
+    """列出目錄下每份文件的來源檔，回傳 {doc_id: [檔名, ...]}
+
+    文件來源為 <doc_id>.json（取 text 欄位）與 <doc_id>.txt；同一份文件兩者都有時
+    以 .txt 為準（與 merge_txt_and_json 相同）。merged 等子目錄不會被掃描。
+    """
+    documents = {}
+    for filename in sorted(os.listdir(category_dir)):
+        stem, ext = os.path.splitext(filename)
+        if ext not in ('.json', '.txt') or not os.path.isfile(os.path.join(category_dir, filename)):
+            continue
+        try:
+            doc_id = int(stem)
+        except ValueError:
+            continue
+        documents.setdefault(doc_id, []).append(filename)
+    return documents
+
+
+def read_document(category_dir, filenames):
+    """讀出一份文件的文字，.txt 優先於 .json"""
+    filenames = sorted(filenames, key=lambda name: name.endswith('.txt'), reverse=True)
+    path = os.path.join(category_dir, filenames[0])
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.txt'):
+            return f.read()
+        data = json.load(f)
+    return str(data.get('text', '')) if isinstance(data, dict) else str(data)
+
+
+def file_state(path, previous=None):
+    """檔案的 mtime、大小與內容 hash；mtime 與大小都沒變時沿用先前的 hash，不重讀檔案"""
+    stat = os.stat(path)
+    if previous and previous['mtime_ns'] == stat.st_mtime_ns and previous['size'] == stat.st_size:
+        return previous
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'hash': file_hash(path)}
+
+
+def diff_documents(category_dir, manifest):
+    """比對目錄與 manifest，回傳 (新 manifest, 新增或修改的 doc id, 移除的 doc id)"""
+    manifest = manifest or {}
+    new_manifest = {}
+    changed = []
+    for doc_id, filenames in scan_documents(category_dir).items():
+        previous = manifest.get(doc_id, {})
+        files = {name: file_state(os.path.join(category_dir, name), previous.get(name)) for name in filenames}
+        new_manifest[doc_id] = files
+        # 只比較內容 hash：檔案被 touch 但內容不變時不算修改
+        if {name: state['hash'] for name, state in files.items()} != \
+                {name: state['hash'] for name, state in previous.items()}:
+            changed.append(doc_id)
+    removed = sorted(set(manifest) - set(new_manifest))
+    return new_manifest, changed, removed
+
+
+def update_index(index, category_dir, manifest_file, tokenize_texts):
+    """依 manifest 增量更新索引，只對新增或修改的文件重新分詞
+
+    index 為 BM25Index 或 PassageIndex（皆提供 apply_changes）；tokenize_texts 將文字列表
+    轉為詞序列列表。回傳 (各類變動的文件數, 新 manifest)；manifest 應在索引存檔後才寫回。
+    """
+    manifest = load_manifest(manifest_file)
+    new_manifest, changed, removed = diff_documents(category_dir, manifest)
+    previous = manifest or {}
+    texts = [read_document(category_dir, new_manifest[doc_id]) for doc_id in changed]
+    docs = list(zip(changed, tokenize_texts(texts)))
+    if docs or removed:
+        index.apply_changes(docs, removed=removed)
+    stats = {
+        'added': sum(1 for doc_id in changed if doc_id not in previous),
+        'changed': sum(1 for doc_id in changed if doc_id in previous),
+        'removed': len(removed),
+    }
+    return stats, new_manifest
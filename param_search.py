@@ -0,0 +1,173 @@
+import math
+import time
+import random
+import itertools
+
+import numpy as np
+from scipy.stats import norm
+
+try:
+    from sklearn.gaussian_process import GaussianProcessRegressor
+    from sklearn.gaussian_process.kernels import ConstantKernel, Matern, WhiteKernel
+except ImportError:  # scikit-learn 為選用套件，沒有安裝時 bayes 模式退化為隨機搜尋
+    GaussianProcessRegressor = None
+
+
+SEARCH_MODES = ('grid', 'halving', 'bayes')
+
+
+class BudgetExhausted(Exception):
+    """評估次數或時間預算用完"""
+
+
+class Budget:
+    """以評估次數與（或）秒數限制搜尋，兩者皆未設定時不限制"""
+
+    def __init__(self, max_evals=None, max_seconds=None):
+        self.max_evals = max_evals
+        self.max_seconds = max_seconds
+        self.evals = 0
+        self.start = time.monotonic()
+
+    @property
+    def exhausted(self):
+        if self.max_evals is not None and self.evals >= self.max_evals:
+            return True
+        return self.max_seconds is not None and time.monotonic() - self.start >= self.max_seconds
+
+    def spend(self):
+        """用掉一次評估；預算已用完時丟出 BudgetExhausted"""
+        if self.exhausted:
+            raise BudgetExhausted()
+        self.evals += 1
+
+
+class SearchSpace:
+    """參數空間：值為 list 時是離散選項，為 {"low", "high"}（可加 "log": true）時是連續範圍
+
+    例如 {"k1": {"low": 0.3, "high": 2.0}, "b": {"low": 0.1, "high": 1.0}, "n": [1]}。
+    param_config.json 的 param_grid（全部為 list）也是合法的空間。
+    """
+
+    def __init__(self, spec):
+        for name, values in spec.items():
+            if isinstance(values, dict):
+                if not values['low'] < values['high']:
+                    raise ValueError(f"Invalid range for {name}: {values}")
+            elif not values:
+                raise ValueError(f"No choices for {name}")
+        self.spec = spec
+        self.names = list(spec)
+
+    @property
+    def is_discrete(self):
+        return all(not isinstance(values, dict) for values in self.spec.values())
+
+    def grid(self):
+        """所有離散組合（僅限全部為離散選項的空間）"""
+        return [dict(zip(self.names, combination)) for combination in itertools.product(*self.spec.values())]
+
+    def sample(self, rng):
+        """隨機抽一組參數，連續值取到小數第 4 位"""
+        params = {}
+        for name, values in self.spec.items():
+            if not isinstance(values, dict):
+                params[name] = rng.choice(values)
+            elif values.get('log'):
+                params[name] = round(math.exp(rng.uniform(math.log(values['low']), math.log(values['high']))), 4)
+            else:
+                params[name] = round(rng.uniform(values['low'], values['high']), 4)
+        return params
+
+    def encode(self, params):
+        """將參數轉成 [0, 1]^d 的向量，供高斯過程使用"""
+        vector = []
+        for name, values in self.spec.items():
+            value = params[name]
+            if not isinstance(values, dict):
+                vector.append(values.index(value) / (len(values) - 1) if len(values) > 1 else 0.0)
+            elif values.get('log'):
+                low, high = math.log(values['low']), math.log(values['high'])
+                vector.append((math.log(value) - low) / (high - low))
+            else:
+                vector.append((value - values['low']) / (values['high'] - values['low']))
+        return vector
+
+
+def unique_samples(space, rng, count):
+    """抽出最多 count 組不重複的參數；離散空間的組合數不超過 count 時直接使用全部組合"""
+    if space.is_discrete:
+        combinations = space.grid()
+        if len(combinations) <= count:
+            return combinations
+        return rng.sample(combinations, count)
+    samples, seen = [], set()
+    for _ in range(count * 20):
+        params = space.sample(rng)
+        key = tuple(params[name] for name in space.names)
+        if key not in seen:
+            seen.add(key)
+            samples.append(params)
+            if len(samples) == count:
+                break
+    return samples
+
+
+def halving_schedule(n_candidates, n_questions, eta=3, min_questions=10):
+    """每一輪的 (候選數, 題數)：候選每輪剩 1/eta，題數每輪乘以 eta，最後一輪使用全部題目"""
+    rungs = max(1, int(math.floor(math.log(n_candidates, eta) + 1e-9)) + 1) if n_candidates > 1 else 1
+    schedule = []
+    for rung in range(rungs):
+        questions = n_questions if rung == rungs - 1 else \
+            min(n_questions, max(min_questions, int(n_questions / eta ** (rungs - 1 - rung))))
+        schedule.append((max(1, n_candidates // eta ** rung), questions))
+    return schedule
+
+
+def successive_halving(evaluate, space, n_questions, n_candidates=27, eta=3, min_questions=10, seed=42):
+    """successive halving：先以少量題目評估大量候選，每輪只保留前 1/eta 並增加題數
+
+    evaluate(params, n) 回傳前 n 題的 accuracy。回傳最後一輪的 [(params, accuracy)]，依 accuracy 排序。
+    """
+    rng = random.Random(seed)
+    candidates = unique_samples(space, rng, n_candidates)
+    survivors = candidates
+    scored = []
+    for keep, questions in halving_schedule(len(candidates), n_questions, eta, min_questions):
+        survivors = survivors[:keep]
+        print(f"\nSuccessive halving: {len(survivors)} candidates on {questions} questions")
+        scored = [(params, evaluate(params, questions)) for params in survivors]
+        # 同分時維持原本順序，結果可重現
+        scored.sort(key=lambda item: -item[1])
+        survivors = [params for params, _ in scored]
+    return scored
+
+
+def expected_improvement(mu, sigma, best, xi=0.01):
+    sigma = np.maximum(sigma, 1e-12)
+    z = (mu - best - xi) / sigma
+    return (mu - best - xi) * norm.cdf(z) + sigma * norm.pdf(z)
+
+
+def bayesian_search(evaluate, space, n_questions, n_init=5, max_iter=50, n_samples=2000, seed=42):
+    """以高斯過程與 expected improvement 選下一組參數，在全部題目上評估
+
+    前 n_init 組（或沒有 scikit-learn 時的每一組）為隨機抽樣。回傳 [(params, accuracy)]。
+    """
+    rng = random.Random(seed)
+    if GaussianProcessRegressor is None:
+        print("Warning: scikit-learn is not installed, falling back to random search")
+    history = []
+    for _ in range(max_iter):
+        if len(history) < n_init or GaussianProcessRegressor is None:
+            params = space.sample(rng)
+        else:
+            X = np.array([space.encode(p) for p, _ in history])
+            y = np.array([accuracy for _, accuracy in history])
+            kernel = ConstantKernel() * Matern(nu=2.5) + WhiteKernel(noise_level=1e-4)
+            gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True, random_state=seed).fit(X, y)
+            candidates = [space.sample(rng) for _ in range(n_samples)]
+            mu, sigma = gp.predict(np.array([space.encode(p) for p in candidates]), return_std=True)
+            params = candidates[int(np.argmax(expected_improvement(mu, sigma, y.max())))]
+        history.append((params, evaluate(params, n_questions)))
+    return history
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import contextlib
+
+try:
+    import pyinstrument
+except ImportError:  # pyinstrument 為選用套件，沒有安裝時只能使用 cProfile
+    pyinstrument = None
+
+
+# 各階段：load 讀檔、tokenize 分詞、expand 同義詞擴展、index_build 建立索引（BM25Okapi 或 BM25Index）、
+# prepare 查詢統計量、score 計分、rank 排序並取回文件 id
+STAGES = ('load', 'tokenize', 'expand', 'index_build', 'prepare', 'score', 'rank')
+CAPTURE_MODES = ('cprofile', 'pyinstrument')
+
+
+class Profiler:
+    """各階段的呼叫次數與累計時間，以及 tokens、候選文件等計數器
+
+    預設關閉：stage() 只檢查一次 enabled 就直接執行，count() 直接返回。
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """計時一個階段；巢狀的階段各自累計（外層包含內層的時間）"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            calls, seconds = self.stages.get(name, (0, 0.0))
+            self.stages[name] = (calls + 1, seconds + time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """JSON 可序列化的摘要"""
+        return {
+            'stages': {
+                name: {'calls': calls, 'seconds': seconds, 'mean_ms': seconds * 1000 / calls if calls else 0.0}
+                for name, (calls, seconds) in self.stages.items()
+            },
+            'counters': dict(self.counters)
+        }
+
+    def merge(self, summary):
+        """加入另一個 process（例如 grid search 的 worker）的摘要"""
+        for name, stats in summary['stages'].items():
+            calls, seconds = self.stages.get(name, (0, 0.0))
+            self.stages[name] = (calls + stats['calls'], seconds + stats['seconds'])
+        for name, value in summary['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_prometheus(self, prefix='bm25'):
+        """Prometheus text exposition format"""
+        lines = [
+            f'# HELP {prefix}_stage_seconds_total Total time spent in each stage.',
+            f'# TYPE {prefix}_stage_seconds_total counter',
+        ]
+        lines += [f'{prefix}_stage_seconds_total{{stage="{name}"}} {seconds!r}'
+                  for name, (_, seconds) in sorted(self.stages.items())]
+        lines += [
+            f'# HELP {prefix}_stage_calls_total Number of times each stage ran.',
+            f'# TYPE {prefix}_stage_calls_total counter',
+        ]
+        lines += [f'{prefix}_stage_calls_total{{stage="{name}"}} {calls}'
+                  for name, (calls, _) in sorted(self.stages.items())]
+        for name, value in sorted(self.counters.items()):
+            lines += [f'# TYPE {prefix}_{name}_total counter', f'{prefix}_{name}_total {value}']
+        return '\n'.join(lines) + '\n'
+
+    def save(self, json_path=None, prometheus_path=None):
+        """寫出 JSON 摘要與（或）Prometheus 格式"""
+        if json_path:
+            _write_text(json_path, json.dumps(self.summary(), ensure_ascii=False, indent=2))
+            print(f"Profile summary saved to: {json_path}")
+        if prometheus_path:
+            _write_text(prometheus_path, self.to_prometheus())
+            print(f"Prometheus metrics saved to: {prometheus_path}")
+
+    def report(self):
+        """印出各階段時間，依累計時間排序"""
+        print("\n=== Stage timings ===")
+        for name, (calls, seconds) in sorted(self.stages.items(), key=lambda item: -item[1][1]):
+            print(f"{name:<12} calls={calls:<8} total={seconds:.3f}s mean={seconds * 1000 / calls:.3f}ms")
+        for name, value in sorted(self.counters.items()):
+            print(f"{name}: {value}")
+
+
+def _write_text(path, text):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def capture(func, mode='cprofile', output_path=None):
+    """以 cProfile 或 pyinstrument 執行 func() 並回傳其結果
+
+    cProfile 的結果存成 .prof（可用 snakeviz 等工具開啟）並印出累計時間前 30 名；
+    pyinstrument 的結果存成 HTML 並印出文字版的呼叫樹。
+    """
+    if mode not in CAPTURE_MODES:
+        raise ValueError(f"Unknown capture mode: {mode}")
+    if mode == 'pyinstrument':
+        if pyinstrument is None:
+            raise ImportError("pyinstrument is not installed (pip install pyinstrument)")
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        try:
+            result = func()
+        finally:
+            profiler.stop()
+        print(profiler.output_text(unicode=True))
+        output_path = output_path or 'profile.html'
+        _write_text(output_path, profiler.output_html())
+    else:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(30)
+        output_path = output_path or 'profile.prof'
+        profiler.dump_stats(output_path)
+    print(f"Profile saved to: {output_path}")
+    return result
+
+
+# bm25_tuner 與 bm25_retrieve 共用的 profiler，由命令列參數開啟
+PROFILER = Profiler()
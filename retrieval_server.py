@@ -0,0 +1,144 @@
+import json
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bm25_retrieve import (
+    CATEGORIES, init_jieba, build_category_index, category_index_path, load_or_build_indexes, retrieve_batch
+)
+
+
+class RetrievalService:
+    """常駐的檢索服務：每個類別保留一份記憶體中的索引，jieba 只初始化一次"""
+
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        init_jieba()
+        self.indexes = load_or_build_indexes(args)
+
+    def retrieve(self, items, n=1):
+        """批次檢索，items 為 {qid, query, source, category} 的列表
+
+        n 不是正整數、題目不是物件或 source 為空時丟出 ValueError（回應 400）。
+        """
+        if isinstance(n, bool) or not isinstance(n, int) or n < 1:
+            raise ValueError(f"n must be a positive integer, got {n!r}")
+        if not isinstance(items, list):
+            raise ValueError("questions must be a list")
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError(f"Each question must be an object, got {item!r}")
+            if not item.get('source'):
+                raise ValueError(f"Empty source for question {item.get('qid')}")
+        results = retrieve_batch(items, self.indexes, b=self.args.b, n=n, return_top_n=True,
+                                 idf_scope=self.args.idf_scope, aggregate=self.args.passage_aggregate,
+                                 top_k=self.args.passage_top_k)
+        return [{
+            "qid": item.get('qid'),
+            "retrieve": top_n[0][0],
+            "top_n": [[doc_id, score] for doc_id, score in top_n]
+        } for item, top_n in zip(items, results)]
+
+    def reload(self, categories=None):
+        """重新讀取語料並重建索引，建好後才替換，不影響進行中的查詢"""
+        categories = categories or list(CATEGORIES)
+        for category in categories:
+            if category not in CATEGORIES:
+                raise ValueError(f"Unknown category: {category}")
+
+        with self.lock:
+            indexes = dict(self.indexes)
+            for category in categories:
+                indexes[category] = build_category_index(self.args, category)
+                if self.args.index_dir:
+                    indexes[category].save(category_index_path(self.args, category))
+            self.indexes = indexes
+        return {category: len(self.indexes[category]) for category in categories}
+
+
+class RetrievalHandler(BaseHTTPRequestHandler):
+    """POST /retrieve、POST /reload、GET /health"""
+
+    service = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {
+                "status": "ok",
+                "documents": {category: len(index) for category, index in self.service.indexes.items()}
+            })
+        else:
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+            if self.path == '/retrieve':
+                items = payload['questions'] if isinstance(payload, dict) else payload
+                n = payload.get('n', 1) if isinstance(payload, dict) else 1
+                self._send_json(200, {"answers": self.service.retrieve(items, n=n)})
+            elif self.path == '/reload':
+                if not isinstance(payload, dict):
+                    raise ValueError("Reload payload must be a JSON object")
+                categories = payload.get('categories') or ([payload['category']] if payload.get('category') else None)
+                self._send_json(200, {"reloaded": self.service.reload(categories)})
+            else:
+                self._send_json(404, {"error": f"Unknown path: {self.path}"})
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve BM25 retrieval over HTTP')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='監聽位址')
+    parser.add_argument('--port', type=int, default=8000, help='監聽埠號')
+    parser.add_argument('--source_path', type=str, help='讀取參考資料路徑')
+    parser.add_argument('--dataset_json_path', type=str,
+                       default='/Users/harperdelaviga/dataset_json',
+                       help='JSON檔案路徑')
+    parser.add_argument('--use_merged', type=bool, default=True, help='是否使用合併版JSON檔')
+    parser.add_argument('--index_dir', type=str, default='bm25_index', help='預建倒排索引目錄')
+    parser.add_argument('--b', type=float, default=0.5, help='BM25 b 參數')
+    parser.add_argument('--idf_scope', choices=['subset', 'global'], default='subset',
+                       help='以 source 子集合或整個類別計算 idf 與平均長度')
+    parser.add_argument('--passage_size', type=int, default=0,
+                       help='保險與金融文件切成此長度（詞數）的段落建索引，0 表示以整份文件建索引')
+    parser.add_argument('--passage_overlap', type=int, default=64, help='相鄰段落重疊的詞數')
+    parser.add_argument('--passage_aggregate', choices=['max', 'sum'], default='max',
+                       help='段落分數聚合回文件的方式')
+    parser.add_argument('--passage_top_k', type=int, default=2,
+                       help='passage_aggregate=sum 時加總的段落數')
+    args = parser.parse_args()
+    if args.passage_size and not 0 <= args.passage_overlap < args.passage_size:
+        parser.error('--passage_overlap must be in [0, --passage_size)')
+
+    RetrievalHandler.service = RetrievalService(args)
+    server = ThreadingHTTPServer((args.host, args.port), RetrievalHandler)
+    print(f"Serving BM25 retrieval on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
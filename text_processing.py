@@ -0,0 +1,332 @@
+import os
+import sys
+import pickle
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+
+import jieba
+import numpy as np
+
+
+CUT_MODES = {
+    'cut_for_search': jieba.cut_for_search,
+    'cut': jieba.cut,
+}
+
+# 平行分詞時每個 worker 使用的分詞函式
+_WORKER_CUT = None
+
+
+def _init_tokenizer_worker(dict_path, mode):
+    """worker 啟動時載入一次自定義字典
+
+    worker 以 spawn 啟動，jieba 為全新狀態；若用 fork 繼承了主 process 已載入字典的 jieba，
+    再 load_userdict 一次會重複累加詞頻總數，分詞結果就會與逐篇分詞不同。
+    """
+    global _WORKER_CUT
+    if dict_path:
+        jieba.load_userdict(dict_path)
+    _WORKER_CUT = CUT_MODES[mode]
+
+
+def _tokenize_in_worker(job):
+    position, piece, text = job
+    # intern 讓同一批結果中重複的詞在傳回主 process 時只序列化一次
+    return position, piece, tuple(sys.intern(token) for token in _WORKER_CUT(text))
+
+
+def _split_at_newlines(text, max_chars):
+    """在換行處將長文件切成約 max_chars 字的片段，換行留在前一段結尾"""
+    pieces = []
+    start = 0
+    while len(text) - start > max_chars:
+        cut = text.rfind('\n', start, start + max_chars)
+        if cut < 0:
+            cut = text.find('\n', start + max_chars)
+            if cut < 0:
+                break
+        pieces.append(text[start:cut + 1])
+        start = cut + 1
+    pieces.append(text[start:])
+    return pieces
+
+
+def tokenize_parallel(texts, workers=1, dict_path=None, mode='cut_for_search', deterministic=True,
+                      chunksize=8, max_chars=20000):
+    """以 process pool 平行分詞，回傳與 texts 同順序的分詞結果（list of list）
+
+    每個 worker 啟動時只載入一次自定義字典。deterministic=True 時以整份文件為單位、
+    依序收集（imap），結果與逐篇分詞完全相同；否則長文件會在換行處切段，
+    以 imap_unordered 依完成順序收集後再依位置接回，負載較平均。
+    workers <= 1 時邊讀邊分詞，不會先把所有文字讀成一個 list。
+    dict_path 應與主 process 載入的自定義字典相同，逐篇分詞（workers <= 1）才會得到相同結果。
+    """
+    cut = CUT_MODES[mode]
+    if workers <= 1:
+        return [list(cut(str(text))) for text in texts]
+
+    texts = [str(text) for text in texts]
+    if len(texts) < 2:
+        return [list(cut(text)) for text in texts]
+
+    if deterministic:
+        jobs = [(position, 0, text) for position, text in enumerate(texts)]
+    else:
+        jobs = [(position, piece, part) for position, text in enumerate(texts)
+                for piece, part in enumerate(_split_at_newlines(text, max_chars))]
+
+    pieces = [[] for _ in texts]
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=_init_tokenizer_worker, initargs=(dict_path, mode)) as pool:
+        if deterministic:
+            results = pool.imap(_tokenize_in_worker, jobs, chunksize=chunksize)
+        else:
+            results = pool.imap_unordered(_tokenize_in_worker, jobs, chunksize=1)
+        for position, piece, tokens in results:
+            pieces[position].append((piece, tokens))
+
+    tokenized = []
+    for parts in pieces:
+        parts.sort(key=lambda part: part[0])
+        tokenized.append([sys.intern(token) for _, tokens in parts for token in tokens])
+    return tokenized
+
+
+def file_hash(path):
+    """計算檔案內容的 hash，檔案不存在時回傳 'none'"""
+    if not path or not os.path.exists(path):
+        return 'none'
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_hash(text):
+    """計算文字內容的 hash"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+class TokenCache:
+    """jieba 分詞結果的磁碟快取
+
+    快取依 (自定義字典 hash, 分詞模式, jieba 版本) 分檔存放，檔內以文字內容 hash 為 key。
+    修改 custom_dict.txt 只會讓舊字典的快取檔失效；存的是停用詞過濾前的分詞結果，
+    停用詞在載入後才套用，所以修改停用詞檔不需重新分詞。
+    """
+
+    MODES = CUT_MODES
+
+    def __init__(self, cache_dir, dict_path=None, mode='cut_for_search'):
+        if mode not in self.MODES:
+            raise ValueError(f"Unsupported cut mode: {mode}")
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.dict_path = dict_path
+        self.dict_hash = file_hash(dict_path)
+        self.path = os.path.join(cache_dir, f"tokens_{mode}_{jieba.__version__}_{self.dict_hash}.pkl")
+
+        self._entries = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        """載入此字典版本的快取檔"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                self._entries = pickle.load(f)
+            print(f"Loaded {len(self._entries)} cached tokenizations from {self.path}")
+        except Exception as e:
+            print(f"Error loading token cache {self.path}: {e}")
+            self._entries = {}
+
+    def save(self):
+        """有新的分詞結果時寫回磁碟"""
+        if not self._dirty:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self._entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def tokenize(self, text):
+        """回傳 text 的分詞結果，未命中時以 jieba 分詞並寫入快取"""
+        key = text_hash(text)
+        tokens = self._entries.get(key)
+        if tokens is None:
+            self.misses += 1
+            # intern 讓重複的詞在 pickle 中只存一次
+            tokens = tuple(sys.intern(token) for token in self.MODES[self.mode](text))
+            self._entries[key] = tokens
+            self._dirty = True
+        else:
+            self.hits += 1
+        return list(tokens)
+
+    def tokenize_many(self, texts, workers=1, deterministic=True):
+        """批次分詞，只把未命中的文字交給 tokenize_parallel，回傳與 texts 同順序的結果
+
+        deterministic=False 的結果來自在換行處切段的文字，可能與整份文件分詞不同，
+        所以只回傳、不寫入快取，之後的 deterministic 執行不會讀到它。
+        """
+        if workers <= 1:
+            return [self.tokenize(str(text)) for text in texts]
+
+        texts = [str(text) for text in texts]
+        keys = [text_hash(text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self._entries and key not in missing:
+                missing[key] = text
+
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        if missing:
+            tokenized = tokenize_parallel(missing.values(), workers=workers, dict_path=self.dict_path,
+                                          mode=self.mode, deterministic=deterministic)
+            if not deterministic:
+                results = dict(zip(missing, tokenized))
+                return [list(self._entries[key]) if key in self._entries else list(results[key]) for key in keys]
+            for key, tokens in zip(missing, tokenized):
+                self._entries[key] = tuple(sys.intern(token) for token in tokens)
+            self._dirty = True
+        return [list(self._entries[key]) for key in keys]
+
+
+class SynonymExpander:
+    """同義詞查詢擴展
+
+    同義詞字典依類別編譯成字元 trie，一次走完連續最多 3 個詞的所有可能詞組；
+    (query, category) 的擴展結果放在 LRU 快取中，同義詞檔修改後自動失效。
+    """
+
+    MAX_PHRASE_TOKENS = 3
+
+    def __init__(self, synonyms, path=None, cache_size=4096):
+        self.synonyms = synonyms
+        self.path = path
+        self.cache_size = cache_size
+        self._mtime = self._file_mtime()
+        self._cache = OrderedDict()
+        self._tries = {category: self._build_trie(entries) for category, entries in synonyms.items()}
+
+    def _file_mtime(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        return os.stat(self.path).st_mtime_ns
+
+    def is_stale(self):
+        """同義詞檔在建立後是否被修改過"""
+        return self._file_mtime() != self._mtime
+
+    @staticmethod
+    def _build_trie(entries):
+        """將詞組編譯成字元 trie，None 標記詞組結尾"""
+        trie = {}
+        for phrase in entries:
+            node = trie
+            for char in phrase:
+                node = node.setdefault(char, {})
+            node[None] = phrase
+        return trie
+
+    def _longest_match(self, trie, words, i):
+        """從 words[i] 開始，最多串接 3 個詞，回傳能對上字典詞組的最長詞數（0 表示沒有）"""
+        node = trie
+        best = 0
+        for j in range(min(self.MAX_PHRASE_TOKENS, len(words) - i)):
+            for char in words[i + j]:
+                node = node.get(char)
+                if node is None:
+                    return best
+            if None in node:
+                best = j + 1
+        return best
+
+    def expand(self, query, category):
+        """回傳 (擴展後的查詢字串, 權重字典)，結果會被快取"""
+        key = (query, category)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached[0], dict(cached[1])
+
+        result = self._expand(query, category)
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result[0], dict(result[1])
+
+    def _expand(self, query, category):
+        entries = self.synonyms[category]
+        trie = self._tries[category]
+        words = list(jieba.cut_for_search(query))
+        expanded_words = []
+        weight_dict = {}
+        used_synonyms = set()
+
+        i = 0
+        while i < len(words):
+            # 先嘗試匹配較長的詞組
+            length = self._longest_match(trie, words, i)
+            if length:
+                phrase = ''.join(words[i:i + length])
+                if phrase not in used_synonyms:
+                    phrase_data = entries[phrase]
+                    weight = phrase_data["weight"]
+
+                    # 添加原詞組
+                    expanded_words.append(phrase)
+                    weight_dict[phrase] = weight
+                    used_synonyms.add(phrase)
+
+                    # 添加同義詞
+                    for syn in phrase_data["synonyms"]:
+                        if syn not in used_synonyms:
+                            expanded_words.append(syn)
+                            weight_dict[syn] = weight
+                            used_synonyms.add(syn)
+                i += length
+            else:
+                word = words[i]
+                if word not in used_synonyms:
+                    expanded_words.append(word)
+                    used_synonyms.add(word)
+                i += 1
+
+        return ' '.join(expanded_words), weight_dict
+
+
+class StopwordFilter:
+    """編譯好的停用詞過濾器
+
+    同義詞中的詞不能被當作停用詞移除，建立時就先把它們從停用詞中扣掉，
+    過濾時每個詞只需一次 frozenset 查詢。
+    """
+
+    def __init__(self, stopwords, synonyms=None):
+        protected = set()
+        for category in (synonyms or {}):
+            for word, word_data in synonyms[category].items():
+                protected.add(word)
+                protected.update(word_data.get("synonyms", []))
+        self.stopwords = frozenset(set(stopwords) - protected)
+
+    def __call__(self, tokens):
+        """去除空白詞與停用詞"""
+        stopwords = self.stopwords
+        return [token for token in tokens if token.strip() and token not in stopwords]
+
+    def mask(self, vocabulary):
+        """回傳 term id -> 是否保留的布林陣列，可用 term_ids[mask[term_ids]] 一次過濾整份文件"""
+        stopwords = self.stopwords
+        return np.fromiter((bool(term.strip()) and term not in stopwords for term in vocabulary.terms),
+                           dtype=bool, count=len(vocabulary))
@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+
+import numpy as np
+
+
+# 數字越大輸出越多：error 只追蹤答錯的題目，info 每題一行摘要，debug 每題完整的計分說明
+LEVELS = {'off': 0, 'error': 1, 'info': 2, 'debug': 3}
+
+
+def json_default(value):
+    """讓 numpy 的數值與陣列可以直接寫成 JSON"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class Tracer:
+    """結構化的追蹤輸出：依等級與取樣決定要記錄哪些題目，緩衝後以 JSONL 批次寫出
+
+    取樣以 qid 的 hash 決定，同一題在每組參數、每次執行都會一致地被選中或略過。
+    level='off'（預設）時 enabled() 只做一次整數比較，呼叫端在它回傳 False 時
+    不需組出任何記錄內容。
+    """
+
+    def __init__(self, path=None, level='off', sample_rate=1.0, qids=None, buffer_size=256):
+        if level not in LEVELS:
+            raise ValueError(f"Unknown trace level: {level}")
+        self.path = path
+        self.level = LEVELS[level] if path else 0
+        self.sample_rate = sample_rate
+        self.qids = set(qids) if qids else None
+        self.buffer_size = buffer_size
+        self._buffer = []
+        if self.level:
+            atexit.register(self.flush)
+
+    def enabled(self, level, key=None):
+        """level 是否開啟；有給 key（通常是 qid）時同時檢查是否被取樣"""
+        if LEVELS[level] > self.level:
+            return False
+        return key is None or self.sampled(key)
+
+    def sampled(self, key):
+        """指定了 qids 時只追蹤這些題目，否則依 hash 取 sample_rate 比例"""
+        if self.qids is not None:
+            return key in self.qids
+        if self.sample_rate >= 1:
+            return True
+        if self.sample_rate <= 0:
+            return False
+        digest = hashlib.blake2b(str(key).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') / 2 ** 64 < self.sample_rate
+
+    def emit(self, event, **fields):
+        """加入一筆記錄，緩衝滿了才寫檔"""
+        record = {'ts': time.time(), 'event': event, **fields}
+        self._buffer.append(json.dumps(record, ensure_ascii=False, default=json_default))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """一次寫出緩衝中的所有記錄（append，fork 出的 worker 可寫同一個檔案）"""
+        if not self._buffer:
+            return
+        data = '\n'.join(self._buffer) + '\n'
+        self._buffer = []
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(data)
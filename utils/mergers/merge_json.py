@@ -1,5 +1,8 @@
+import os
 import json
+import argparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
 def merge_json_files(input_dir, category):
@@ -27,18 +30,113 @@ def merge_json_files(input_dir, category):
     
     return output_path
 
+def _sort_key(file_path):
+    """檔名為數字時依數字排序，讓輸出順序固定"""
+    return (0, int(file_path.stem), '') if file_path.stem.isdigit() else (1, 0, file_path.stem)
+
+def _read_entry(file_path):
+    """讀取單一 JSON 並轉成一行緊湊的 NDJSON：{"<file_id>": content}"""
+    with open(file_path, 'rb') as f:
+        content = json.loads(f.read())
+    line = json.dumps({file_path.stem: content}, ensure_ascii=False, separators=(',', ':')) + '\n'
+    return line.encode('utf-8')
+
+def merge_json_files_fast(input_dir, category, workers=8):
+    """以 thread pool 平行讀取並輸出 NDJSON（每行一份文件）
+
+    manifest 記錄每個輸入檔的 mtime、大小與它在輸出檔中的位置；
+    沒有變動的檔案直接從上一次的輸出複製該行，不需重新讀取與解析。
+    """
+    input_dir = Path(input_dir)
+    merged_dir = input_dir / "merged"
+    merged_dir.mkdir(exist_ok=True)
+    output_path = merged_dir / f'merged_{category}_corpus.jsonl'
+    manifest_path = merged_dir / f'merged_{category}_corpus.manifest.json'
+
+    manifest = {}
+    if manifest_path.exists() and output_path.exists():
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    file_paths = sorted((f for f in input_dir.glob('*.json') if f.is_file()), key=_sort_key)
+    stats = {f.name: f.stat() for f in file_paths}
+    unchanged = {
+        name for name, stat in stats.items()
+        if name in manifest
+        and manifest[name]['mtime_ns'] == stat.st_mtime_ns
+        and manifest[name]['size'] == stat.st_size
+    }
+    to_read = [f for f in file_paths if f.name not in unchanged]
+    print(f"{category}: {len(unchanged)} 個檔案未變動，{len(to_read)} 個檔案需要讀取")
+
+    # 平行讀取有變動的檔案，I/O 與 json 解析由多個 thread 分擔
+    lines = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {f.name: executor.submit(_read_entry, f) for f in to_read}
+        for name, future in tqdm(futures.items(), desc=f'合併 {category} 文件'):
+            try:
+                lines[name] = future.result()
+            except Exception as e:
+                print(f"處理文件 {input_dir / name} 時發生錯誤: {e}")
+
+    new_manifest = {}
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    previous = open(output_path, 'rb') if unchanged else None
+    try:
+        with open(tmp_path, 'wb') as out:
+            offset = 0
+            for file_path in file_paths:
+                name = file_path.name
+                if name in unchanged:
+                    previous.seek(manifest[name]['offset'])
+                    line = previous.read(manifest[name]['length'])
+                elif name in lines:
+                    line = lines[name]
+                else:
+                    continue
+                out.write(line)
+                new_manifest[name] = {
+                    'mtime_ns': stats[name].st_mtime_ns,
+                    'size': stats[name].st_size,
+                    'offset': offset,
+                    'length': len(line)
+                }
+                offset += len(line)
+    finally:
+        if previous is not None:
+            previous.close()
+
+    os.replace(tmp_path, output_path)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(new_manifest, f, ensure_ascii=False)
+
+    return output_path
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='合併單一文件的 JSON 檔')
+    parser.add_argument('--base_dir', type=str, default="/Users/harperdelaviga/dataset_json",
+                        help='包含 finance/、insurance/ 的資料夾')
+    parser.add_argument('--format', choices=['json', 'jsonl'], default='json',
+                        help='json：原本的縮排 JSON；jsonl：平行讀取、增量更新的 NDJSON')
+    parser.add_argument('--workers', type=int, default=8, help='jsonl 模式讀檔的 thread 數')
+    args = parser.parse_args()
+
     # 使用正確的路徑
-    base_dir = Path("/Users/harperdelaviga/dataset_json")
-    
+    base_dir = Path(args.base_dir)
+
+    def merge(input_dir, category):
+        if args.format == 'jsonl':
+            return merge_json_files_fast(input_dir, category, workers=args.workers)
+        return merge_json_files(input_dir, category)
+
     # 處理 finance 文件
     finance_dir = base_dir / "finance"
     if finance_dir.exists():
-        finance_output = merge_json_files(finance_dir, "finance")
+        finance_output = merge(finance_dir, "finance")
         print(f"Finance 文件已合併至：{finance_output}")
-    
+
     # 處理 insurance 文件
     insurance_dir = base_dir / "insurance"
     if insurance_dir.exists():
-        insurance_output = merge_json_files(insurance_dir, "insurance")
-        print(f"Insurance 文件已合併至：{insurance_output}")
\ No newline at end of file
+        insurance_output = merge(insurance_dir, "insurance")
+        print(f"Insurance 文件已合併至：{insurance_output}")
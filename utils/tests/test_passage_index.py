@@ -0,0 +1,49 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from bm25_index import BM25Index, PassageIndex
+
+
+def check_all_docs_empty():
+    """所有文件都沒有任何詞時段落索引是空的，source 內的文件分數皆為 0"""
+    index = PassageIndex.build([(1, []), (2, [])], passage_size=4, overlap=1)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'passages.idx')
+        index.save(path)
+        index = PassageIndex.load(path)
+    top_n = index.get_top_n(['保險'], [2, 1], n=2)
+    scores = index.get_batch_scores([['保險'], []], [1, 2])
+    print(f"全部為空文件: top_n={top_n}, scores={scores.tolist()}")
+    return sorted(top_n) == [(1, 0.0), (2, 0.0)] and not scores.any()
+
+
+def check_emptied_index():
+    """增量更新移除所有文件後，查詢不存在的文件與 BM25Index 一樣丟出 KeyError"""
+    index = PassageIndex.build([(1, ['保險', '理賠']), (2, ['契約'])], passage_size=4, overlap=1)
+    index.apply_changes(removed=[1, 2])
+    results = []
+    for name, empty_index in (('PassageIndex', index), ('BM25Index', BM25Index.build([]))):
+        try:
+            empty_index.get_top_n(['保險'], [1])
+            results.append(False)
+            print(f"{name}: 沒有丟出 KeyError")
+        except KeyError as e:
+            results.append(True)
+            print(f"{name}: KeyError {e}")
+    return all(results)
+
+
+def main():
+    ok = check_all_docs_empty()
+    ok = check_emptied_index() and ok
+    if ok:
+        print("空的段落索引可正常查詢")
+    else:
+        print("錯誤: 空的段落索引查詢結果不正確")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+from benchmark import generate_corpus, generate_questions, write_dataset
+
+
+def run_search(work_dir, data_dir, dataset_json_path, config_path, mode, extra_args):
+    """在 work_dir 執行一次 bm25_tuner 的 halving/bayes 搜尋，回傳是否成功並寫出結果"""
+    command = [sys.executable, os.path.join(ROOT, 'bm25_tuner.py'),
+               '--data_dir', data_dir, '--dataset_json_path', dataset_json_path,
+               '--config', config_path, '--search', mode] + extra_args
+    completed = subprocess.run(command, cwd=work_dir, capture_output=True, text=True)
+    results_path = os.path.join(work_dir, 'parameter_search_results.json')
+    if completed.returncode != 0 or not os.path.exists(results_path):
+        print(f"{mode}: 執行失敗 (exit code {completed.returncode})")
+        print(completed.stdout[-2000:])
+        print(completed.stderr[-2000:])
+        return False
+    with open(results_path, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+    print(f"{mode}: {len(results['all_results'])} 次評估，最佳參數 {results['best_params']}")
+    return bool(results['all_results']) and results['best_params'] is not None
+
+
+def main():
+    # 與 README 相同，設定檔只有 search_space（沒有 param_grid）
+    config = {"search_space": {"k1": {"low": 0.3, "high": 2.5}, "b": {"low": 0.1, "high": 1.0}, "n": [1]}}
+
+    root = tempfile.mkdtemp(prefix='bm25_search_test_')
+    try:
+        corpus = generate_corpus(20, 100, 500)
+        questions, ground_truths = generate_questions(corpus, 30, 5, 10)
+        data_dir, dataset_json_path = write_dataset(root, corpus, questions, ground_truths)
+        config_path = os.path.join(root, 'search_config.json')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+
+        ok = True
+        for mode, extra_args in (('halving', ['--n_candidates', '4']), ('bayes', ['--budget_evals', '3'])):
+            work_dir = os.path.join(root, mode)
+            os.makedirs(work_dir)
+            ok = run_search(work_dir, data_dir, dataset_json_path, config_path, mode, extra_args) and ok
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if ok:
+        print("只有 search_space 的設定檔可以執行 halving 與 bayes 搜尋")
+    else:
+        print("錯誤: 只有 search_space 的設定檔無法執行搜尋")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import json
+
+import jieba
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from text_processing import tokenize_parallel
+
+
+def check_parallel_matches_serial(texts, dict_path, workers=3):
+    """平行分詞（deterministic）必須與主 process 逐篇分詞的結果完全相同"""
+    serial = [list(jieba.cut_for_search(text)) for text in texts]
+    parallel = tokenize_parallel(texts, workers=workers, dict_path=dict_path)
+    mismatches = [i for i, (a, b) in enumerate(zip(serial, parallel)) if a != b]
+    print(f"{len(texts)} 篇文件，{len(mismatches)} 篇結果不同")
+    for i in mismatches[:5]:
+        print(f"  第 {i} 篇: serial={serial[i][:20]} parallel={parallel[i][:20]}")
+    return not mismatches
+
+
+def main():
+    # 與 bm25_retrieve / bm25_tuner 相同：主 process 先載入自定義字典
+    dict_path = "custom_dict.txt"
+    if os.path.exists(dict_path):
+        jieba.load_userdict(dict_path)
+        print(f"成功載入自定義詞典: {dict_path}")
+    else:
+        dict_path = None
+        print("警告: 找不到自定義詞典文件")
+
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else None
+    if corpus_path:
+        with open(corpus_path, 'r', encoding='utf-8') as f:
+            texts = [str(value) for value in json.load(f).values()]
+    else:
+        texts = [
+            "投資型保單的年化報酬率",
+            "保險契約的要保人可以申請保單借款",
+            "理財型保險商品的投資績效報告",
+            "保單價值準備金與解約金的計算方式",
+            "投資組合的資產配置策略",
+        ] * 4
+
+    if check_parallel_matches_serial(texts, dict_path):
+        print("平行分詞與逐篇分詞結果相同")
+    else:
+        print("錯誤: 平行分詞與逐篇分詞結果不同")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+from benchmark import generate_corpus, generate_questions, write_dataset, write_json
+
+
+def run_retrieve(data_dir, dataset_json_path, index_dir, extra_args):
+    """執行 bm25_retrieve（工作目錄為專案根目錄，才讀得到 custom_dict.txt），回傳是否成功"""
+    command = [sys.executable, os.path.join(ROOT, 'bm25_retrieve.py'),
+               '--source_path', os.path.join(data_dir, 'reference'),
+               '--dataset_json_path', dataset_json_path, '--index_dir', index_dir] + extra_args
+    completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(f"執行失敗: {' '.join(extra_args)} (exit code {completed.returncode})")
+        print(completed.stdout[-2000:])
+        print(completed.stderr[-2000:])
+    return completed.returncode == 0
+
+
+def load_answers(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [answer['retrieve'] for answer in json.load(f)['answers']]
+
+
+def main():
+    root = tempfile.mkdtemp(prefix='bm25_update_test_')
+    try:
+        corpus = generate_corpus(20, 100, 500)
+        questions, ground_truths = generate_questions(corpus, 30, 5, 10)
+        data_dir, dataset_json_path = write_dataset(root, corpus, questions, ground_truths)
+        # 各文件檔只放一半的文件：增量索引只含這些文件，合併版語料仍有全部文件
+        for category in ('insurance', 'finance'):
+            for doc_id, text in list(corpus[category].items())[::2]:
+                write_json(os.path.join(dataset_json_path, category, f'{doc_id}.json'), {'text': text})
+        question_path = os.path.join(data_dir, 'dataset', 'preliminary', 'questions_example.json')
+
+        index_dir = os.path.join(root, 'index')
+        fresh_dir = os.path.join(root, 'fresh_index')
+        output_path = os.path.join(root, 'answers.json')
+        fresh_output_path = os.path.join(root, 'fresh_answers.json')
+        ok = (run_retrieve(data_dir, dataset_json_path, index_dir, ['--update_index'])
+              and run_retrieve(data_dir, dataset_json_path, index_dir,
+                               ['--question_path', question_path, '--output_path', output_path])
+              and run_retrieve(data_dir, dataset_json_path, fresh_dir,
+                               ['--question_path', question_path, '--output_path', fresh_output_path]))
+        if ok:
+            # 一般檢索必須使用合併版語料的索引，結果與全新建立的索引相同
+            ok = load_answers(output_path) == load_answers(fresh_output_path)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if ok:
+        print("--update_index 之後的一般檢索使用合併版語料的索引")
+    else:
+        print("錯誤: --update_index 之後的一般檢索結果與全新索引不同")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()